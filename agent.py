@@ -266,6 +266,9 @@ def run_conversation_for_customer(customer):
         customer_manager.end_conversation(customer_id, conversation_id, "error", {"error": str(e)})
     
     finally:
+        # Write any batched session changes before the files are removed
+        session_manager.close()
+        
         # Clean up customer-specific session files
         customer_manager.cleanup_customer_session_files(customer_id)
 
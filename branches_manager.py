@@ -1,7 +1,87 @@
 import json
 import os
+import re
 import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+# Words that negate a keyword directly after them ("not interested", "don't have questions")
+NEGATION_PREFIX_RE = re.compile(r"(no|not|don'?t) ")
+
+
+class NormalizedInput:
+    """User input together with its lowercased form, computed once per turn"""
+    
+    __slots__ = ("raw", "lower")
+    
+    def __init__(self, raw: Optional[str]):
+        self.raw = raw
+        self.lower = raw.lower() if raw else ""
+    
+    @classmethod
+    def of(cls, user_input: Any) -> "NormalizedInput":
+        """Return user_input unchanged if it is already normalized, otherwise normalize it"""
+        return user_input if isinstance(user_input, cls) else cls(user_input)
+
+
+class KeywordMatcher:
+    """
+    Precompiled keyword lookup for one branch's expected user responses.
+    Keywords are lowercased once, and a single regex alternation tells in one pass
+    whether the input contains any of them.
+    """
+    
+    def __init__(self, expected_responses: Optional[Dict[str, Any]]):
+        """
+        Build the matcher from a branch's expected_user_responses.
+        
+        Args:
+            expected_responses (Dict): Response type to response data (with optional keywords)
+        """
+        self.expected_responses = expected_responses
+        self.entries: List[Tuple[str, Tuple[str, ...]]] = []
+        
+        all_keywords = set()
+        for response_type, response_data in (expected_responses or {}).items():
+            keywords = tuple(keyword.lower() for keyword in response_data.get("keywords", []))
+            if keywords:
+                self.entries.append((response_type, keywords))
+                all_keywords.update(keywords)
+        
+        self.all_keywords = frozenset(all_keywords)
+        self.any_keyword_re = re.compile("|".join(map(re.escape, sorted(all_keywords)))) if all_keywords else None
+    
+    def has_any_keyword(self, user_input_lower: str) -> bool:
+        """
+        Check whether any keyword occurs in the lowercased user input.
+        
+        Args:
+            user_input_lower (str): Lowercased user input
+        
+        Returns:
+            bool: True if at least one keyword is a substring of the input
+        """
+        return self.any_keyword_re is not None and self.any_keyword_re.search(user_input_lower) is not None
+    
+    def negated_keywords(self, user_input_lower: str) -> Set[str]:
+        """
+        Find keywords the user negates, e.g. "no questions", "not interested", "i don't have time".
+        
+        Args:
+            user_input_lower (str): Lowercased user input
+        
+        Returns:
+            Set[str]: Keywords directly preceded by no/not/don't/dont or "i don't have"/"i dont have"
+        """
+        negated = set()
+        for match in NEGATION_PREFIX_RE.finditer(user_input_lower):
+            starts = [match.end()]
+            # "i don't have <keyword>" also counts as a negation
+            if (match.group(1).startswith("don") and user_input_lower.startswith("have ", match.end())
+                    and user_input_lower.endswith("i ", 0, match.start())):
+                starts.append(match.end() + len("have "))
+            for start in starts:
+                negated.update(keyword for keyword in self.all_keywords if user_input_lower.startswith(keyword, start))
+        return negated
 
 
 class BranchesManager:
@@ -22,6 +102,16 @@ class BranchesManager:
         self.suggestions_file_path = suggestions_file_path
         self.branches = self._load_branches()
         self.suggestions = self._load_suggestions()
+        self._keyword_matchers: Dict[str, KeywordMatcher] = {}
+        self._build_keyword_matchers()
+    
+    def _build_keyword_matchers(self) -> None:
+        """Lowercase and compile every branch's keywords up front so no match call pays for it."""
+        self._keyword_matchers = {
+            branch_name: KeywordMatcher(branch.get("expected_user_responses"))
+            for branch_name, branch in self.branches.items()
+            if isinstance(branch, dict)
+        }
     
     def _load_branches(self) -> Dict[str, Any]:
         """Load branches from the JSON file."""
@@ -146,6 +236,27 @@ class BranchesManager:
         """
         return self.branches.get(branch_name)
     
+    def get_keyword_matcher(self, branch_name: str) -> Optional[KeywordMatcher]:
+        """
+        Get the precompiled keyword matcher for a branch, rebuilding it if the branch was edited.
+        
+        Args:
+            branch_name (str): Name of the branch
+        
+        Returns:
+            KeywordMatcher or None: Matcher for the branch's expected responses, None if the branch doesn't exist
+        """
+        branch = self.branches.get(branch_name)
+        if not branch:
+            return None
+        
+        expected_responses = branch.get("expected_user_responses")
+        matcher = self._keyword_matchers.get(branch_name)
+        if matcher is None or matcher.expected_responses is not expected_responses:
+            matcher = KeywordMatcher(expected_responses)
+            self._keyword_matchers[branch_name] = matcher
+        return matcher
+    
     def read_all_branches(self) -> Dict[str, Any]:
         """
         Read all branches.
@@ -464,6 +575,7 @@ class BranchesManager:
         self._save_suggestions()
         if results["applied"] > 0:
             self._save_branches()
+            self._build_keyword_matchers()
         
         # Show detailed results
         if verbose:
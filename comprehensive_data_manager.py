@@ -3,11 +3,14 @@ Comprehensive Data Manager
 Manages all customer data, sessions, conversations, and analytics in a single JSON structure
 """
 import json
+import orjson
 import os
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 import uuid
 
+from file_utils import atomic_write
+
 
 class ComprehensiveDataManager:
     """Manages all BotBuddy data in a unified JSON structure"""
@@ -19,8 +22,8 @@ class ComprehensiveDataManager:
     def _load_comprehensive_data(self) -> Dict[str, Any]:
         """Load comprehensive data from file or create default structure"""
         try:
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(self.data_file, 'rb') as f:
+                return orjson.loads(f.read())
         except FileNotFoundError:
             return self._create_default_structure()
     
@@ -211,14 +214,17 @@ class ComprehensiveDataManager:
         self._save_data(default_data)
         return default_data
     
+    def dump_data(self, data: Dict[str, Any] = None) -> bytes:
+        """Stamp and serialize comprehensive data to UTF-8 JSON bytes"""
+        data_to_save = data or self.data
+        data_to_save["metadata"]["last_updated"] = datetime.now().isoformat()
+        return orjson.dumps(data_to_save, option=orjson.OPT_INDENT_2)
+    
     def _save_data(self, data: Dict[str, Any] = None) -> bool:
         """Save comprehensive data to file"""
         try:
-            data_to_save = data or self.data
-            data_to_save["metadata"]["last_updated"] = datetime.now().isoformat()
-            
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, indent=4, ensure_ascii=False)
+            # Write to a temp file and rename so a crash never leaves a truncated file
+            atomic_write(self.data_file, self.dump_data(data))
             return True
         except Exception as e:
             print(f"Error saving comprehensive data: {e}")
@@ -303,30 +309,53 @@ class ComprehensiveDataManager:
         
         return False
     
+    def _find_conversation(self, customer_id: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Find a conversation record by ID"""
+        if customer_id not in self.data["customers"]:
+            return None
+        
+        for conversation in self.data["customers"][customer_id]["conversations"]:
+            if conversation["conversation_id"] == conversation_id:
+                return conversation
+        return None
+    
+    def _append_chat_message(self, conversation: Dict[str, Any], user_input: str, bot_response: str,
+                             metadata: Dict[str, Any] = None, timestamp: str = None) -> None:
+        """Append a chat message to a conversation record without saving"""
+        chat_entry = {
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "user": user_input,
+            "bot": bot_response,
+            "metadata": metadata or {}
+        }
+        
+        conversation["chat_history"].append(chat_entry)
+        conversation["session_data"]["chat_history"].append({
+            "user": user_input,
+            "veena": bot_response
+        })
+    
     def add_chat_message(self, customer_id: str, conversation_id: str, user_input: str, bot_response: str, metadata: Dict[str, Any] = None) -> bool:
         """Add a chat message to conversation history"""
-        if customer_id not in self.data["customers"]:
+        conversation = self._find_conversation(customer_id, conversation_id)
+        if not conversation:
             return False
         
-        conversations = self.data["customers"][customer_id]["conversations"]
-        for conversation in conversations:
-            if conversation["conversation_id"] == conversation_id:
-                chat_entry = {
-                    "timestamp": datetime.now().isoformat(),
-                    "user": user_input,
-                    "bot": bot_response,
-                    "metadata": metadata or {}
-                }
-                
-                conversation["chat_history"].append(chat_entry)
-                conversation["session_data"]["chat_history"].append({
-                    "user": user_input,
-                    "veena": bot_response
-                })
-                
-                return self._save_data()
+        self._append_chat_message(conversation, user_input, bot_response, metadata)
+        return self._save_data()
+    
+    def flush_conversation_updates(self, customer_id: str, conversation_id: str, session_updates: Dict[str, Any],
+                                   messages: List[Dict[str, Any]], save: bool = True) -> bool:
+        """Apply batched session updates and chat messages with a single save"""
+        conversation = self._find_conversation(customer_id, conversation_id)
+        if not conversation:
+            return False
         
-        return False
+        for message in messages:
+            self._append_chat_message(conversation, message["user"], message["bot"],
+                                      message.get("metadata"), message.get("timestamp"))
+        conversation["session_data"].update(session_updates)
+        return self._save_data() if save else True
     
     def get_all_customers(self) -> List[Dict[str, Any]]:
         """Get list of all customers with combined data"""
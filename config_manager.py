@@ -26,6 +26,11 @@ class ConfigManager:
             "gemini_model": os.getenv("GEMINI_MODEL", "gemini-pro"),
             "api_timeout": int(os.getenv("API_TIMEOUT", "30")),
             
+            # Text-to-Speech Settings
+            "tts_model": os.getenv("TTS_MODEL", "eleven_flash_v2_5"),
+            "tts_optimize_streaming_latency": int(os.getenv("TTS_OPTIMIZE_STREAMING_LATENCY", "3")),
+            "tts_output_format": os.getenv("TTS_OUTPUT_FORMAT", "pcm_16000"),
+            
             # File Paths
             "branches_file": os.getenv("BRANCHES_FILE", "branches.json"),
             "suggestions_file": os.getenv("SUGGESTIONS_FILE", "suggestions.json"),
@@ -80,7 +85,10 @@ class ConfigManager:
         return {
             "api_key": self.get("api_key"),
             "model": self.get("gemini_model"),
-            "timeout": self.get("api_timeout")
+            "timeout": self.get("api_timeout"),
+            "tts_model": self.get("tts_model"),
+            "optimize_streaming_latency": self.get("tts_optimize_streaming_latency"),
+            "output_format": self.get("tts_output_format")
         }
     
     def get_conversation_config(self) -> Dict[str, Any]:
@@ -254,7 +254,8 @@ class CustomerManager:
         """Clean up customer-specific session files"""
         files_to_remove = [
             f"user_data_{customer_id}.json",
-            f"session_data_{customer_id}.json"
+            f"session_data_{customer_id}.json",
+            f"session_data_{customer_id}_chat_history.ndjson"
         ]
         
         for file_path in files_to_remove:
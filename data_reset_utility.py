@@ -74,7 +74,8 @@ class DataResetUtility:
         # Pattern for session files
         session_patterns = [
             "user_data_customer_*.json",
-            "session_data_customer_*.json"
+            "session_data_customer_*.json",
+            "session_data_customer_*_chat_history.ndjson"
         ]
         
         try:
@@ -263,21 +263,56 @@ async def text_to_speech_stream():
         print(f"❌ Error: {e}")
         return None
 
-async def convert_single_text(text, voice_id=None, voice_settings=None):
+def build_tts_uri(voice_id=None, model_id="eleven_multilingual_v2", optimize_streaming_latency=None,
+                  output_format=None, inactivity_timeout=None):
     """
-    Convert a single text string to speech using WebSocket streaming
+    Build the ElevenLabs stream-input WebSocket URL for a voice and model
+    """
+    uri = f"wss://api.elevenlabs.io/v1/text-to-speech/{voice_id or VOICE_ID}/stream-input?model_id={model_id}"
+    if optimize_streaming_latency is not None:
+        uri += f"&optimize_streaming_latency={optimize_streaming_latency}"
+    if output_format:
+        uri += f"&output_format={output_format}"
+    if inactivity_timeout:
+        uri += f"&inactivity_timeout={inactivity_timeout}"
+    return uri
+
+async def open_tts_connection(voice_id=None, model_id="eleven_multilingual_v2", optimize_streaming_latency=None,
+                              output_format=None, inactivity_timeout=60):
+    """
+    Open a stream-input WebSocket ahead of time so the handshake happens off the critical path
+    
+    Returns:
+        Connected websocket to pass to convert_single_text, or None if the connection failed
+    """
+    uri = build_tts_uri(voice_id, model_id, optimize_streaming_latency, output_format, inactivity_timeout)
+    try:
+        return await websockets.connect(uri)
+    except Exception as e:
+        print(f"⚠️ Could not pre-connect to ElevenLabs: {e}")
+        return None
+
+async def stream_audio_chunks(text, voice_id=None, voice_settings=None, model_id="eleven_multilingual_v2",
+                             optimize_streaming_latency=None, output_format=None, websocket=None):
+    """
+    Stream synthesized audio for a text string, yielding chunks as they arrive over the WebSocket
     
     Args:
         text (str): Text to convert to speech
         voice_id (str): Voice ID to use (optional)
         voice_settings (dict): Voice settings (optional)
+        model_id (str): ElevenLabs model, e.g. "eleven_flash_v2_5" for low latency
+        optimize_streaming_latency (int): Latency optimization level 0-4 (optional)
+        output_format (str): Audio format such as "pcm_16000" or "mp3_44100_128" (optional)
+        websocket: Connection from open_tts_connection to reuse (optional)
     
-    Returns:
-        bytes: Audio data as MP3 bytes, or None if failed
-    """
-    if voice_id is None:
-        voice_id = VOICE_ID
+    Yields:
+        bytes: Decoded audio chunks in the requested output format
     
+    Raises:
+        ConnectionClosed / JSONDecodeError if the stream ends before ElevenLabs marks it final,
+        so callers can tell truncated audio from a complete utterance
+    """
     if voice_settings is None:
         # Optimized settings for Hindi female voice with empathy
         voice_settings = {
@@ -288,61 +323,99 @@ async def convert_single_text(text, voice_id=None, voice_settings=None):
             "use_speaker_boost": True  # Enhanced voice clarity for Hindi
         }
     
-    uri = f"wss://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream-input"
+    uri = build_tts_uri(voice_id, model_id, optimize_streaming_latency, output_format)
+    
+    if websocket is None:
+        websocket = await websockets.connect(uri)
     
     try:
-        async with websockets.connect(uri) as websocket:
-            print(f"🔗 Converting text: '{text[:50]}{'...' if len(text) > 50 else ''}'")
-            
-            # Send initialization message with full text, optimized settings, and multilingual model
-            init_message = {
-                "text": text,
-                "voice_settings": voice_settings,
-                "model_id": "eleven_multilingual_v2",  # Best model for Hindi support
-                "xi_api_key": API_KEY
-            }
-            
+        print(f"🔗 Converting text: '{text[:50]}{'...' if len(text) > 50 else ''}'")
+        
+        # Send initialization message with full text and optimized settings (model is set in the URL)
+        init_message = {
+            "text": text,
+            "voice_settings": voice_settings,
+            "xi_api_key": API_KEY
+        }
+        
+        try:
             await websocket.send(json.dumps(init_message))
+        except websockets.exceptions.ConnectionClosed:
+            # A pre-opened connection may have been closed while idle; reconnect once
+            websocket = await websockets.connect(uri)
+            await websocket.send(json.dumps(init_message))
+        
+        # Send final empty message to trigger generation
+        await websocket.send(json.dumps({"text": ""}))
+        
+        # Yield audio chunks as they arrive; a dropped connection or bad frame propagates to the caller
+        while True:
+            response = await websocket.recv()
+            data = json.loads(response)
             
-            # Send final empty message to trigger generation
-            await websocket.send(json.dumps({"text": ""}))
-            
-            # Collect audio chunks
-            audio_chunks = []
-            while True:
-                try:
-                    response = await websocket.recv()
-                    data = json.loads(response)
-                    
-                    if "audio" in data and data["audio"] is not None:
-                        audio_data = base64.b64decode(data["audio"])
-                        audio_chunks.append(audio_data)
-                        
-                    if data.get("isFinal", False):
-                        break
-                        
-                except (websockets.exceptions.ConnectionClosed, json.JSONDecodeError):
-                    break
-            
-            combined_audio = b''.join(audio_chunks)
-            
-            if len(combined_audio) == 0:
-                print("⚠️ ElevenLabs returned 0 bytes of audio. This might be due to:")
-                print("   1. Free Tier usage disabled due to unusual activity detection")
-                print("   2. VPN/Proxy triggering abuse detectors") 
-                print("   3. Account restrictions or quota exceeded")
-                print("   4. Consider upgrading to a paid plan or checking network settings")
-            else:
-                print(f"✅ Generated {len(combined_audio)} bytes of audio")
-            
-            return combined_audio
+            if "audio" in data and data["audio"] is not None:
+                yield base64.b64decode(data["audio"])
+                
+            if data.get("isFinal", False):
+                break
+    
+    finally:
+        await websocket.close()
+
+def report_empty_audio():
+    """
+    Explain the likely causes when ElevenLabs returns no audio
+    """
+    print("⚠️ ElevenLabs returned 0 bytes of audio. This might be due to:")
+    print("   1. Free Tier usage disabled due to unusual activity detection")
+    print("   2. VPN/Proxy triggering abuse detectors") 
+    print("   3. Account restrictions or quota exceeded")
+    print("   4. Consider upgrading to a paid plan or checking network settings")
+
+def report_tts_error(error):
+    """
+    Print a text-to-speech failure with troubleshooting hints
+    """
+    print(f"❌ Error converting text to speech: {error}")
+    print("💡 If you're getting permission errors, check:")
+    print("   - API key validity and permissions")
+    print("   - Account status (Free Tier restrictions)")
+    print("   - Network settings (VPN/Proxy issues)")
+
+async def convert_single_text(text, voice_id=None, voice_settings=None, model_id="eleven_multilingual_v2",
+                              optimize_streaming_latency=None, output_format=None, websocket=None):
+    """
+    Convert a single text string to speech using WebSocket streaming
+    
+    Args:
+        text (str): Text to convert to speech
+        voice_id (str): Voice ID to use (optional)
+        voice_settings (dict): Voice settings (optional)
+        model_id (str): ElevenLabs model, e.g. "eleven_flash_v2_5" for low latency
+        optimize_streaming_latency (int): Latency optimization level 0-4 (optional)
+        output_format (str): Audio format such as "pcm_16000" or "mp3_44100_128" (optional)
+        websocket: Connection from open_tts_connection to reuse (optional)
+    
+    Returns:
+        bytes: Audio data in the requested output format (MP3 by default), or None if failed
+    """
+    try:
+        audio_chunks = []
+        async for chunk in stream_audio_chunks(text, voice_id, voice_settings, model_id,
+                                               optimize_streaming_latency, output_format, websocket):
+            audio_chunks.append(chunk)
+        
+        combined_audio = b''.join(audio_chunks)
+        
+        if len(combined_audio) == 0:
+            report_empty_audio()
+        else:
+            print(f"✅ Generated {len(combined_audio)} bytes of audio")
+        
+        return combined_audio
             
     except Exception as e:
-        print(f"❌ Error converting text to speech: {e}")
-        print("💡 If you're getting permission errors, check:")
-        print("   - API key validity and permissions")
-        print("   - Account status (Free Tier restrictions)")
-        print("   - Network settings (VPN/Proxy issues)")
+        report_tts_error(e)
         return None
 
 # Example usage functions
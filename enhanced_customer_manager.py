@@ -2,6 +2,7 @@
 Enhanced Customer Manager with Comprehensive Data Integration
 """
 from comprehensive_data_manager import ComprehensiveDataManager
+from file_utils import atomic_write
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 import uuid
@@ -304,9 +305,8 @@ class EnhancedCustomerManager:
                     if k not in ["id", "phone", "conversation_status", "last_call_attempt", "call_attempts", "priority", "analytics", "tags", "notes"]}
         
         # Save user data file
-        import json
-        with open(user_data_file, 'w', encoding='utf-8') as f:
-            json.dump(user_data, f, indent=4, ensure_ascii=False)
+        import orjson
+        atomic_write(user_data_file, orjson.dumps(user_data, option=orjson.OPT_INDENT_2))
         
         # Check if this is a callback and we need to restore previous session state
         session_data = self._get_session_data_for_callback(customer_id) or {
@@ -322,8 +322,7 @@ class EnhancedCustomerManager:
         }
         
         # Save session data file
-        with open(session_data_file, 'w', encoding='utf-8') as f:
-            json.dump(session_data, f, indent=4, ensure_ascii=False)
+        atomic_write(session_data_file, orjson.dumps(session_data, option=orjson.OPT_INDENT_2))
         
         return user_data_file, session_data_file
         
@@ -364,7 +363,8 @@ class EnhancedCustomerManager:
         import os
         files_to_remove = [
             f"user_data_{customer_id}.json",
-            f"session_data_{customer_id}.json"
+            f"session_data_{customer_id}.json",
+            f"session_data_{customer_id}_chat_history.ndjson"
         ]
         
         for file_path in files_to_remove:
@@ -386,3 +386,10 @@ class EnhancedCustomerManager:
                 conv["session_data"].update(session_updates)
                 return self.data_manager._save_data()
         return False
+    
+    def flush(self, customer_id: str, conversation_id: str, session_updates: Dict[str, Any],
+              messages: List[Dict[str, Any]], save: bool = True) -> bool:
+        """Write batched session updates and chat messages for a conversation in one save"""
+        if not session_updates and not messages:
+            return True
+        return self.data_manager.flush_conversation_updates(customer_id, conversation_id, session_updates, messages, save)
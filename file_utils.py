@@ -0,0 +1,19 @@
+"""
+File Utilities Module
+Crash-safe file writes shared by the session and data managers
+"""
+import os
+
+
+def atomic_write(path: str, content: bytes) -> None:
+    """Write content to a temp file and swap it into place, so readers never see a partial file"""
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except Exception:
+        # Don't leave a stale temp file behind when the write or rename fails
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -2,23 +2,52 @@
 Voice Agent Module for BotBuddy
 Voice-enabled conversation agent with customer selection
 """
-from eleven_websocket import convert_single_text, play_audio_async
+from eleven_websocket import convert_single_text, open_tts_connection, play_audio_async, stream_audio_chunks, VOICE_ID
 from dotenv import load_dotenv
 from config_manager import ConfigManager
 from session_manager import SessionManager
+from file_utils import atomic_write
 from response_analyzer import ResponseAnalyzer
 from conversation_flow_controller import ConversationFlowController
 from branches_manager import BranchesManager
 from interruption_handler import InterruptionHandler
 from enhanced_customer_manager import EnhancedCustomerManager
+from gemini_api import send_to_gemini
+from prompt_builder import RECENT_HISTORY_TURNS
 import os
 import json
 import re
 import asyncio
+import threading
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
 import speech_recognition as sr
+import pyaudio
+
+# Branches whose bot_prompt is played as the final message of a call
+CLOSURE_BRANCHES = frozenset({"closure", "payment_success_closure", "complaint_resolution_closure", "schedule_callback"})
+
+# Synthesized branch prompts and scripted replies shared across calls, keyed by SHA1 of text + voice + model;
+# one-off Gemini replies are never cached
+TTS_CACHE_SIZE = 256
+_tts_cache = OrderedDict()
+
+# Barge-in: consecutive mic frames above energy_threshold * factor stop the bot's playback
+BARGE_IN_FRAMES = 3
+BARGE_IN_ENERGY_FACTOR = 3
+PLAYBACK_SLICE_BYTES = 3200  # ~100ms of 16-bit mono PCM at 16kHz
+
+# Capture speech at 16kHz so each turn's PCM and FLAC upload stay small
+MIC_SAMPLE_RATE = 16000
+
+# The prompt shows only the most recent turns; older ones are folded into a periodic summary
+PROMPT_HISTORY_TURNS = RECENT_HISTORY_TURNS
+SUMMARY_INTERVAL_TURNS = 20
 
 class VoiceAgent:
-    def __init__(self, customer_data=None, api_key=None):
+    def __init__(self, api_key=None):
         # Load environment variables from .env file
         load_dotenv()
         
@@ -45,24 +74,116 @@ class VoiceAgent:
         api_config = self.config.get_api_config()
         self.api_key = api_key or api_config["api_key"]
         
+        # Text-to-speech model options passed to every synthesis request
+        self._tts_opts = {
+            "model_id": api_config["tts_model"],
+            "optimize_streaming_latency": api_config["optimize_streaming_latency"],
+            "output_format": api_config["output_format"]
+        }
+        
+        # Short confirmatory replies answered from the script without calling Gemini
+        self._fast_intents = {
+            re.compile(r"^\s*(yes|yeah|yep|sure|okay|ok|confirm)\W*$", re.I): "affirmative",
+            re.compile(r"^\s*(no|nope|not now|later)\W*$", re.I): "negative"
+        }
+        
+        # TTS WebSocket opened while the user is speaking, consumed by the next synthesis
+        self._next_tts_ws = None
+        
+        # Set when the customer starts talking over the bot
+        self._barge_in_event = asyncio.Event()
+        # Mic frames that triggered the barge-in, prepended to the next capture
+        self._barge_in_frames = []
+        
         # Speech recognition setup
         self.recognizer = sr.Recognizer()
         self.recognizer.energy_threshold = 150  # Adjust as needed
+        
+        # Open the microphone once and reuse it for every turn, capturing at the rate Google ASR uses
+        self._mic_source = sr.Microphone(sample_rate=MIC_SAMPLE_RATE).__enter__()
+        
+        # Persistent speaker stream so raw PCM audio plays while it is still being synthesized
+        self._pyaudio = None
+        self._speaker = None
+        output_format = self._tts_opts["output_format"] or ""
+        if output_format.startswith("pcm_"):
+            self._pyaudio = pyaudio.PyAudio()
+            self._speaker = self._pyaudio.open(
+                format=pyaudio.paInt16, channels=1, rate=int(output_format.split("_")[1]), output=True
+            )
 
         # Customer-specific data (will be set when customer is selected)
-        self.current_customer = customer_data
+        self.current_customer = None
         self.customer_id = None
         self.conversation_id = None
         self.session_manager = None
         self.conversation_controller = None
         self.user_data = None
         self.session_data = None
+        self._placeholder_re = None
         
-        # Initialize for selected customer if provided
-        if customer_data:
-            self._initialize_customer_session(customer_data)
+        # Background Gemini call that refreshes session_data["summary_so_far"], and how many
+        # chat history entries that summary already covers
+        self._summary_task = None
+        self._last_summarized_len = 0
+        
+        # Comprehensive-data writes batched per turn and flushed together
+        self._pending_updates = {}
+        self._pending_messages = []
+        
+        # Background writer that keeps JSON persistence off the event loop
+        self._write_queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer_loop())
+    
+    @classmethod
+    async def create(cls, customer_data=None, api_key=None):
+        """Create a voice agent, setting up the customer session while the microphone calibrates"""
+        agent = cls(api_key=api_key)
+        try:
+            if customer_data:
+                # Let calibration finish even if the session setup fails, so the mic is idle when released
+                results = await asyncio.gather(
+                    agent._initialize_customer_session(customer_data),
+                    asyncio.to_thread(agent._calibrate_microphone),
+                    return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
+            else:
+                await asyncio.to_thread(agent._calibrate_microphone)
+        except BaseException:
+            # The caller never gets the agent, so release the mic, speaker and writer here
+            await agent.aclose()
+            raise
+        return agent
     
-    def _initialize_customer_session(self, customer_data):
+    async def aclose(self):
+        """Finish pending writes and release the microphone, speaker, TTS connection and session files"""
+        # Drop an in-flight summary so a late result can't update a closed session or hold up shutdown
+        if self._summary_task is not None and not self._summary_task.done():
+            self._summary_task.cancel()
+            try:
+                await self._summary_task
+            except asyncio.CancelledError:
+                pass
+        await self.drain_writes()
+        await self.close_tts_connection()
+        self.close_audio_output()
+        self._mic_source.__exit__(None, None, None)
+        if self.session_manager:
+            self.session_manager.close()
+        
+        # Clean up customer-specific session files
+        if self.customer_id:
+            self.customer_manager.cleanup_customer_session_files(self.customer_id)
+    
+    def _calibrate_microphone(self):
+        """Calibrate for ambient noise once per call instead of on every turn"""
+        self.recognizer.adjust_for_ambient_noise(self._mic_source, duration=0.5)
+        self.recognizer.dynamic_energy_threshold = False
+    
+    async def _initialize_customer_session(self, customer_data):
         """Initialize session for a specific customer"""
         self.current_customer = customer_data
         self.customer_id = customer_data["id"]
@@ -71,15 +192,17 @@ class VoiceAgent:
         print(f"\n🔄 Setting up voice conversation for {customer_name}...")
         
         # Start a new conversation in comprehensive data system
-        self.conversation_id = self.customer_manager.start_conversation(self.customer_id)
+        self.conversation_id = await asyncio.to_thread(self.customer_manager.start_conversation, self.customer_id)
         if not self.conversation_id:
             raise Exception("Failed to start conversation!")
         
-        # Create customer-specific session files for compatibility
-        user_data_file, session_data_file = self.customer_manager.create_session_files_for_customer(customer_data)
+        # Create customer-specific session files for compatibility (they record the new conversation ID)
+        user_data_file, session_data_file = await asyncio.to_thread(
+            self.customer_manager.create_session_files_for_customer, customer_data
+        )
         
         # Initialize session manager for this customer
-        self.session_manager = SessionManager(user_data_file, session_data_file)
+        self.session_manager = await asyncio.to_thread(SessionManager, user_data_file, session_data_file)
         
         # Initialize conversation flow controller
         api_config = self.config.get_api_config()
@@ -94,42 +217,273 @@ class VoiceAgent:
         self.session_data = self.session_manager.get_session_data()
         self.user_data = self.session_manager.get_user_data()
         
+        # Compile one placeholder pattern per session for single-pass rendering
+        if self.user_data:
+            self._placeholder_re = re.compile(r"\{(" + "|".join(map(re.escape, self.user_data.keys())) + r")\}")
+        
         print(f"✅ Voice session initialized for {customer_name}")
     
     def save_session(self):
         """Save current session data to file and comprehensive data system"""
         try:
             if self.session_manager:
-                self.session_manager.save_session()
+                self._queue_session_save(force=True)
             
             if self.customer_id and self.conversation_id and self.customer_manager:
-                session_data = self.session_manager.get_session_data()
-                self.customer_manager.update_session_in_comprehensive_data(
-                    self.customer_id, self.conversation_id, session_data
-                )
+                self._pending_updates.update(self.session_manager.get_session_data())
+                self._flush_pending_updates()
                 
         except Exception as e:
             print(f"❌ Error saving session: {e}")
 
-    async def text_to_speech(self, text):
-        """Convert text to speech using ElevenLabs"""
+    def _queue_chat_message(self, user_input, bot_response, metadata=None):
+        """Buffer a chat message for the next comprehensive data flush"""
+        self._pending_messages.append({
+            "timestamp": datetime.now().isoformat(),
+            "user": user_input,
+            "bot": bot_response,
+            "metadata": metadata
+        })
+
+    def _flush_pending_updates(self):
+        """Apply buffered session updates and chat messages and queue a single save"""
+        if not self._pending_updates and not self._pending_messages:
+            return
+        
+        self.customer_manager.flush(
+            self.customer_id, self.conversation_id, self._pending_updates, self._pending_messages, save=False
+        )
+        self._pending_updates = {}
+        self._pending_messages = []
+        
+        data_manager = self.customer_manager.data_manager
+        content = data_manager.dump_data()
+        # Only the latest snapshot of the data file needs to reach the disk
+        self._write_queue.put_nowait((data_manager.data_file, lambda: atomic_write(data_manager.data_file, content), True))
+
+    def _queue_session_save(self, force=False):
+        """Queue the session manager's pending state and new chat turns for the background writer"""
+        pending = self.session_manager.collect_pending_writes(force=force)
+        if pending:
+            # Chat turns are appended, so every session write has to run (in order)
+            self._write_queue.put_nowait(
+                (self.session_manager.session_data_file, lambda: self.session_manager.write_pending(pending), False)
+            )
+
+    async def _writer_loop(self):
+        """Drain queued writes in order, keeping only the latest of the replaceable writes per file"""
+        while True:
+            batch = [await self._write_queue.get()]
+            while not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            
+            writes = {}
+            for index, (path, write, replaceable) in enumerate(batch):
+                writes[path if replaceable else index] = (path, write)
+            
+            for path, write in writes.values():
+                try:
+                    await asyncio.to_thread(write)
+                except Exception as e:
+                    print(f"❌ Error writing {path}: {e}")
+            
+            for _ in batch:
+                self._write_queue.task_done()
+
+    async def drain_writes(self):
+        """Wait for queued writes to finish and stop the background writer"""
+        await self._write_queue.join()
+        self._writer_task.cancel()
+
+    def _render_placeholders(self, message):
+        """Replace {placeholders} in a branch message with user data"""
+        if not self._placeholder_re:
+            return message
+        return self._placeholder_re.sub(lambda m: str(self.user_data[m.group(1)]), message)
+
+    def _tts_cache_key(self, text):
+        """Build the TTS cache key for text with the current voice, model and format"""
+        key = f"{text}|{VOICE_ID}|{self._tts_opts['model_id']}|{self._tts_opts['output_format']}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _lookup_tts_task(self, cache_key):
+        """Return the cached synthesis task for a key, or None if missing or unusable"""
+        task = _tts_cache.get(cache_key)
+        if task is not None and task.done() and (task.cancelled() or task.exception() or not task.result()):
+            return None  # Retry syntheses that failed or returned no audio
+        if task is not None:
+            _tts_cache.move_to_end(cache_key)
+        return task
+
+    def _store_tts_task(self, cache_key, task):
+        """Cache a synthesis task (or completed future), evicting the least recently used"""
+        _tts_cache[cache_key] = task
+        if len(_tts_cache) > TTS_CACHE_SIZE:
+            _tts_cache.popitem(last=False)
+
+    def _get_tts_task(self, text):
+        """Return the (possibly in-flight) synthesis task for text, starting one on cache miss"""
+        cache_key = self._tts_cache_key(text)
+        task = self._lookup_tts_task(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._synthesize(text))
+            self._store_tts_task(cache_key, task)
+        return task
+
+    def _prefetch_tts_connection(self):
+        """Start opening the next TTS WebSocket so its handshake overlaps with listening"""
+        if self._next_tts_ws is None:
+            self._next_tts_ws = asyncio.create_task(open_tts_connection(**self._tts_opts))
+
+    async def _take_tts_connection(self):
+        """Hand over the prefetched TTS connection, or None if there is none"""
+        if self._next_tts_ws is None:
+            return None
+        pending_ws, self._next_tts_ws = self._next_tts_ws, None
+        return await pending_ws
+
+    async def _synthesize(self, text):
+        """Synthesize text, using the prefetched TTS connection when one is available"""
+        websocket = await self._take_tts_connection()
+        return await convert_single_text(text, websocket=websocket, **self._tts_opts)
+
+    async def close_tts_connection(self):
+        """Close a prefetched TTS WebSocket that was never used"""
+        websocket = await self._take_tts_connection()
+        if websocket is not None:
+            await websocket.close()
+
+    def close_audio_output(self):
+        """Close the persistent speaker stream"""
+        if self._speaker is not None:
+            self._speaker.stop_stream()
+            self._speaker.close()
+            self._pyaudio.terminate()
+            self._speaker = None
+
+    def _prewarm_tts_cache(self):
+        """Start synthesizing the greeting and closure messages so they replay instantly"""
+        stages = set(CLOSURE_BRANCHES)
+        if self.session_data.get("conversation_stage") == "greeting":
+            stages.add("greeting")
+        
+        for stage in stages:
+            branch = self.branches_manager.read_branch(stage)
+            if branch and branch.get("bot_prompt"):
+                self._get_tts_task(self._render_placeholders(branch["bot_prompt"]))
+
+    def _watch_for_barge_in(self, loop, stop):
+        """Read mic frames while the bot speaks and flag sustained speech as a barge-in"""
+        threshold = self.recognizer.energy_threshold * BARGE_IN_ENERGY_FACTOR
+        loud_frames = []
+        try:
+            while not stop.is_set():
+                frame = self._mic_source.stream.read(self._mic_source.CHUNK)
+                # RMS of the 16-bit samples, matching how the recognizer measures energy
+                rms = np.sqrt(np.mean(np.frombuffer(frame, np.int16).astype(np.float32) ** 2))
+                if rms > threshold:
+                    loud_frames.append(frame)
+                    if len(loud_frames) >= BARGE_IN_FRAMES:
+                        # Keep the start of the interrupting sentence for speech_to_text
+                        self._barge_in_frames = loud_frames
+                        loop.call_soon_threadsafe(self._barge_in_event.set)
+                        return
+                else:
+                    loud_frames = []
+        except OSError as e:
+            print(f"⚠️ Barge-in monitor stopped: {e}")
+
+    async def _play_audio(self, audio_data):
+        """Play a complete audio buffer on the speaker stream, or via pygame for MP3"""
+        if self._speaker is None:
+            await play_audio_async(audio_data)
+            return
+        
+        # Slice through a memoryview so each playback slice is a view, not a copy
+        audio_view = memoryview(audio_data)
+        for start in range(0, len(audio_view), PLAYBACK_SLICE_BYTES):
+            if self._barge_in_event.is_set():
+                print("🛑 Customer started speaking - stopping playback")
+                return
+            await asyncio.to_thread(self._speaker.write, audio_view[start:start + PLAYBACK_SLICE_BYTES])
+
+    async def _stream_text_to_speech(self, text, cache_key=None):
+        """Play PCM chunks as ElevenLabs sends them, caching the assembled audio under cache_key once the stream completes"""
+        websocket = await self._take_tts_connection()
+        stream = stream_audio_chunks(text, websocket=websocket, **self._tts_opts)
+        chunks = []
+        remainder = b""
         try:
-            audio_data = await convert_single_text(text)
+            async for chunk in stream:
+                if self._barge_in_event.is_set():
+                    print("🛑 Customer started speaking - stopping playback")
+                    return  # Closing the stream closes the socket and abandons generation
+                chunks.append(chunk)
+                # Only write whole 16-bit samples; carry an odd trailing byte into the next chunk
+                if remainder:
+                    chunk = remainder + chunk
+                usable = len(chunk) - len(chunk) % 2
+                remainder = chunk[usable:]
+                if usable:
+                    await asyncio.to_thread(self._speaker.write, memoryview(chunk)[:usable])
+        finally:
+            await stream.aclose()
+        
+        # Only reached after isFinal; dropped streams raise above so truncated audio is never cached
+        audio_data = b"".join(chunks)
+        if audio_data:
+            print(f"✅ Streamed {len(audio_data)} bytes of audio")
+        if audio_data and cache_key:
+            done = asyncio.get_running_loop().create_future()
+            done.set_result(audio_data)
+            self._store_tts_task(cache_key, done)
+
+    async def text_to_speech(self, text, cache=False):
+        """Convert text to speech using ElevenLabs, replaying cached audio when available; cache=True stores scripted text"""
+        # Watch the mic during playback so the customer can interrupt the bot
+        self._barge_in_event.clear()
+        self._barge_in_frames = []
+        stop_watching = threading.Event()
+        watcher = None
+        if self._speaker is not None:
+            watcher = asyncio.create_task(
+                asyncio.to_thread(self._watch_for_barge_in, asyncio.get_running_loop(), stop_watching)
+            )
+        
+        try:
+            cache_key = self._tts_cache_key(text)
+            task = self._lookup_tts_task(cache_key)
+            if task is None and self._speaker is not None:
+                await self._stream_text_to_speech(text, cache_key if cache else None)
+                return
+            
+            if task is None:
+                task = self._get_tts_task(text) if cache else self._synthesize(text)
+            audio_data = await task
             if audio_data:
-                await play_audio_async(audio_data)
+                await self._play_audio(audio_data)
         except Exception as e:
             print(f"TTS Error: {e}")
+        finally:
+            stop_watching.set()
+            if watcher is not None:
+                await watcher
 
     async def speech_to_text(self):
         """Convert speech to text using speech recognition"""
         try:
-            with sr.Microphone() as source:
-                print("\n🎤 Listening... (speak now)")
-                self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                audio = self.recognizer.listen(source, timeout=10, phrase_time_limit=8)
-                
+            print("\n🎤 Listening... (speak now)")
+            barge_in_frames, self._barge_in_frames = self._barge_in_frames, []
+            audio = await asyncio.to_thread(self.recognizer.listen, self._mic_source, timeout=10, phrase_time_limit=8)
+            
+            # Put back the frames the barge-in monitor consumed so the first words are not lost
+            if barge_in_frames:
+                audio = sr.AudioData(
+                    b"".join(barge_in_frames) + audio.get_raw_data(), audio.sample_rate, audio.sample_width
+                )
+            
             print("🔄 Processing speech...")
-            text = self.recognizer.recognize_google(audio)
+            text = await asyncio.to_thread(self.recognizer.recognize_google, audio)
             print(f"👤 You said: {text}")
             return text
             
@@ -143,6 +497,87 @@ class VoiceAgent:
             print(f"❌ Speech recognition error: {e}")
             return None
 
+    def _refresh_summary(self):
+        """Start folding the turns that left the prompt window since the last summary into it, in the background"""
+        if self._summary_task is not None and not self._summary_task.done():
+            return
+        
+        chat_history = self.session_data.get("chat_history", [])
+        summarized_len = max(len(chat_history) - PROMPT_HISTORY_TURNS, 0)
+        transcript_lines = []
+        for turn in chat_history[self._last_summarized_len:summarized_len]:
+            if turn.get("user"):
+                transcript_lines.append(f'User: {turn["user"]}')
+            if turn.get("veena"):
+                transcript_lines.append(f'Veena: {turn["veena"].partition("```")[0].strip()}')
+        
+        if transcript_lines:
+            self._summary_task = asyncio.create_task(self._summarize("\n".join(transcript_lines), summarized_len))
+
+    async def _summarize(self, transcript, summarized_len):
+        """Ask Gemini to fold new turns into the running summary and store it in the session"""
+        # Send the previous summary instead of the whole transcript so the request stays bounded
+        previous_summary = self.session_data.get("summary_so_far")
+        if previous_summary:
+            transcript = f"Summary of the call so far:\n{previous_summary}\n\nLater turns:\n{transcript}"
+        prompt = (
+            "Summarize this insurance policy renewal call in 3-4 sentences. Keep the customer's concerns, "
+            f"commitments, amounts and dates.\n\n{transcript}"
+        )
+        summary = (await asyncio.to_thread(send_to_gemini, prompt, self.api_key)).strip()
+        if not summary or summary.startswith("Sorry, something went wrong"):
+            return  # Keep the previous summary if Gemini failed; the same turns are retried next turn
+        
+        self._last_summarized_len = summarized_len
+        self.session_manager.update_session({"summary_so_far": summary})
+        self._pending_updates["summary_so_far"] = summary
+
+    def _fast_intent(self, user_input):
+        """Classify short yes/no style replies, returning None for anything else"""
+        for pattern, intent in self._fast_intents.items():
+            if pattern.match(user_input):
+                return intent
+        return None
+
+    def _fast_intent_response(self, user_input, current_stage):
+        """
+        Answer a short yes/no reply straight from branches.json.
+        Returns (bot_response, metadata), or None to fall through to the flow controller.
+        """
+        fast_intent = self._fast_intent(user_input)
+        if not fast_intent:
+            return None
+        
+        # Leave language switches, interruptions and callback confirmations to the controller
+        session_data = self.session_data
+        if session_data.get("language_preference", "English") != "English":
+            return None
+        if self.interruption_handler.is_in_interruption_flow(session_data) or session_data.get("returned_from_interruption"):
+            return None
+        if session_data.get("is_callback") and session_data.get("callback_continuation") and not session_data.get("callback_confirmed"):
+            return None
+        is_interruption, _, _ = self.interruption_handler.detect_interruption(user_input, current_stage, confidence_threshold=0.4)
+        if is_interruption:
+            return None
+        
+        # Closure moves without a scripted line fall through so the closure message is only spoken once
+        scripted_reply = self.response_analyzer.get_scripted_reply(user_input, current_stage, CLOSURE_BRANCHES)
+        if not scripted_reply:
+            return None
+        matched_type, bot_response, next_stage = scripted_reply
+        
+        print(f"⚡ FAST INTENT: '{fast_intent}' → {matched_type}, next stage '{next_stage or current_stage}'")
+        current_branch = self.branches_manager.read_branch(current_stage)
+        metadata = {
+            "intent": current_branch.get("intent", "unknown") if current_branch else "unknown",
+            "fast_intent": fast_intent,
+            "update": {
+                "conversation_stage": next_stage or current_stage,
+                "language_preference": session_data.get("language_preference", "English")
+            }
+        }
+        return self._render_placeholders(bot_response), metadata
+
     async def process_conversation_turn(self, user_input=None):
         """Process a single conversation turn with interruption handling using new architecture"""
         
@@ -161,15 +596,21 @@ class VoiceAgent:
                     expected_types = list(current_branch.get("expected_user_responses", {}).keys())
                     print(f"🔍 DEBUG: Expected response types: {expected_types}")
             
-            # Process conversation turn with interruption handling
-            bot_response, metadata, conversation_continues = self.conversation_controller.process_conversation_turn(
-                user_input, current_stage, self.user_data, self.session_data
-            )
+            # Serve short yes/no replies from the script, otherwise use the full flow controller
+            fast_response = self._fast_intent_response(user_input, current_stage)
+            # Scripted replies recur across calls, so only their audio is worth caching
+            cache_response = fast_response is not None
+            if fast_response:
+                bot_response, metadata = fast_response
+            else:
+                bot_response, metadata, conversation_continues = self.conversation_controller.process_conversation_turn(
+                    user_input, current_stage, self.user_data, self.session_data
+                )
             
             print(f"🤖 Veena: {bot_response}")
             
             # Add to comprehensive data system
-            self.customer_manager.add_chat_message(self.customer_id, self.conversation_id, user_input, bot_response, metadata)
+            self._queue_chat_message(user_input, bot_response, metadata)
         
         else:
             # Empty input - prompt user to respond instead of calling Gemini
@@ -179,44 +620,48 @@ class VoiceAgent:
         # Update session data based on metadata
         if "update" in metadata:
             self.session_manager.update_session(metadata["update"])
-            self.customer_manager.update_session_in_comprehensive_data(self.customer_id, self.conversation_id, metadata["update"])
+            self._pending_updates.update(metadata["update"])
         if "intent" in metadata:
             self.session_manager.update_session({"last_intent": metadata["intent"]})
-            self.customer_manager.update_session_in_comprehensive_data(self.customer_id, self.conversation_id, {"last_intent": metadata["intent"]})
+            self._pending_updates["last_intent"] = metadata["intent"]
 
         self.session_manager.add_to_chat_history(user_input, bot_response)
+        # A turn can add more than one entry, so compare against what the summary already covers
+        unsummarized = len(self.session_data["chat_history"]) - PROMPT_HISTORY_TURNS - self._last_summarized_len
+        if unsummarized >= SUMMARY_INTERVAL_TURNS:
+            self._refresh_summary()
         
         if self.config.should_auto_save():
-            self.session_manager.save_session()
+            self._queue_session_save()
 
         # Check if we've transitioned to a closure branch and need to display its final message
         current_stage_after_update = self.session_manager.get_current_stage()
-        closure_branches = {"closure", "payment_success_closure", "complaint_resolution_closure", "schedule_callback"}
         
-        if (current_stage_after_update in closure_branches and 
+        if (current_stage_after_update in CLOSURE_BRANCHES and 
             current_stage_after_update != current_stage):  # We just transitioned to a closure branch
             
             # Get the closure branch's bot_prompt and display it
             closure_branch = self.branches_manager.read_branch(current_stage_after_update)
             if closure_branch and "bot_prompt" in closure_branch:
-                final_message = closure_branch["bot_prompt"]
                 # Replace any placeholders with user data
-                for key, value in self.user_data.items():
-                    final_message = final_message.replace(f"{{{key}}}", str(value))
+                final_message = self._render_placeholders(closure_branch["bot_prompt"])
                 
                 print(f"🤖 Veena: {final_message}")
                 
                 # Add this final message to chat history and comprehensive data
                 self.session_manager.add_to_chat_history(None, final_message)
-                self.customer_manager.add_chat_message(self.customer_id, self.conversation_id, None, final_message, 
-                                               {"stage": current_stage_after_update, "final_closure_message": True})
+                self._queue_chat_message(None, final_message,
+                                         {"stage": current_stage_after_update, "final_closure_message": True})
                 
                 # Convert to speech
-                await self.text_to_speech(final_message)
+                await self.text_to_speech(final_message, cache=True)
+
+        # Persist this turn's comprehensive data changes in one write
+        self._flush_pending_updates()
 
         # Convert to speech
         if bot_response:
-            await self.text_to_speech(bot_response)
+            await self.text_to_speech(bot_response, cache=cache_response)
         
         return not self.session_manager.is_conversation_complete()
 
@@ -232,6 +677,9 @@ class VoiceAgent:
         print(f"📞 Calling {customer_name}...")
         print("💡 Tip: Speak clearly after the listening prompt")
         
+        # Synthesize the static greeting/closure messages in the background
+        self._prewarm_tts_cache()
+        
         # === Check if this is a callback continuation and handle appropriately ===
         is_callback = self.session_data.get("is_callback", False)
         if is_callback and self.session_data.get("continued_from_callback"):
@@ -240,12 +688,10 @@ class VoiceAgent:
             print(f"🤖 Veena: {callback_greeting}")
             
             # Add to comprehensive data system
-            self.customer_manager.add_chat_message(
-                self.customer_id, self.conversation_id, None, callback_greeting, {
-                    "stage": self.session_data.get("conversation_stage"),
-                    "callback_continuation": True
-                }
-            )
+            self._queue_chat_message(None, callback_greeting, {
+                "stage": self.session_data.get("conversation_stage"),
+                "callback_continuation": True
+            })
             
             # Update session data to indicate callback has been handled
             callback_updates = {
@@ -254,12 +700,11 @@ class VoiceAgent:
                 "callback_continuation": True
             }
             self.session_manager.update_session(callback_updates)
-            self.customer_manager.update_session_in_comprehensive_data(
-                self.customer_id, self.conversation_id, callback_updates
-            )
+            self._pending_updates.update(callback_updates)
             
             self.session_manager.add_to_chat_history(None, callback_greeting)
-            self.session_manager.save_session()
+            self._queue_session_save()
+            self._flush_pending_updates()
             await self.text_to_speech(callback_greeting)
             
             # Let the user know which stage we're continuing from
@@ -271,36 +716,40 @@ class VoiceAgent:
             # Use static greeting from branches.json instead of calling Gemini
             greeting_branch = self.branches_manager.read_branch("greeting")
             if greeting_branch and "bot_prompt" in greeting_branch:
-                bot_response = greeting_branch["bot_prompt"]
                 # Replace placeholders with user data
-                for key, value in self.user_data.items():
-                    bot_response = bot_response.replace(f"{{{key}}}", str(value))
+                bot_response = self._render_placeholders(greeting_branch["bot_prompt"])
+                cache_greeting = True
             else:
                 # Fallback greeting if branch not found
                 bot_response = f"Hello and very Good Morning Sir, May I speak with {self.user_data.get('policy_holder_name', 'you')}?"
+                cache_greeting = False
             
             print(f"🤖 Veena: {bot_response}")
 
             # Add to comprehensive data system
-            self.customer_manager.add_chat_message(self.customer_id, self.conversation_id, None, bot_response, {"stage": "greeting"})
+            self._queue_chat_message(None, bot_response, {"stage": "greeting"})
 
             # For greeting, we don't need to extract metadata from Gemini response
             # Just set basic metadata manually
             metadata = {"stage": "greeting", "intent": "initial_greeting"}
             self.session_manager.update_session({"last_intent": "initial_greeting"})
-            self.customer_manager.update_session_in_comprehensive_data(self.customer_id, self.conversation_id, {"last_intent": "initial_greeting"})
+            self._pending_updates["last_intent"] = "initial_greeting"
 
             self.session_manager.add_to_chat_history(None, bot_response)
-            self.session_manager.save_session()
-            await self.text_to_speech(bot_response)
+            self._queue_session_save()
+            self._flush_pending_updates()
+            await self.text_to_speech(bot_response, cache=cache_greeting)
 
         # Main conversation loop
         while True:
+            # Open the next TTS connection in the background while the user talks
+            self._prefetch_tts_connection()
             user_input = await self.speech_to_text()
             
             # Handle special commands
             if user_input and user_input.lower() in ['quit', 'exit', 'end']:
                 print("📞 Ending conversation...")
+                await self._write_queue.join()
                 self.customer_manager.end_conversation(self.customer_id, self.conversation_id, "user_terminated")
                 break
             
@@ -308,6 +757,7 @@ class VoiceAgent:
                 continue_conversation = await self.process_conversation_turn(user_input)
                 if not continue_conversation:
                     print(f"✅ Conversation with {customer_name} completed.")
+                    await self._write_queue.join()
                     self.customer_manager.end_conversation(self.customer_id, self.conversation_id, "successful")
                     
                     # Show pending suggestions summary
@@ -377,7 +827,7 @@ async def run_voice_conversation_for_customer(customer):
     
     try:
         # Create voice agent with customer data
-        voice_agent = VoiceAgent(customer_data=customer)
+        voice_agent = await VoiceAgent.create(customer_data=customer)
         
         print(f"\n📞 Starting voice conversation with {customer_name}...")
         print("="*60)
@@ -388,6 +838,7 @@ async def run_voice_conversation_for_customer(customer):
     except KeyboardInterrupt:
         print(f"\n⚠️ Voice conversation with {customer_name} interrupted by user.")
         if 'voice_agent' in locals() and voice_agent.customer_id and voice_agent.conversation_id:
+            await voice_agent.drain_writes()
             voice_agent.customer_manager.end_conversation(
                 voice_agent.customer_id, voice_agent.conversation_id, "interrupted"
             )
@@ -395,14 +846,15 @@ async def run_voice_conversation_for_customer(customer):
     except Exception as e:
         print(f"\n❌ Error during voice conversation with {customer_name}: {e}")
         if 'voice_agent' in locals() and voice_agent.customer_id and voice_agent.conversation_id:
+            await voice_agent.drain_writes()
             voice_agent.customer_manager.end_conversation(
                 voice_agent.customer_id, voice_agent.conversation_id, "error", {"error": str(e)}
             )
     
     finally:
-        # Clean up customer-specific session files
-        if 'voice_agent' in locals() and voice_agent.customer_id:
-            voice_agent.customer_manager.cleanup_customer_session_files(voice_agent.customer_id)
+        # Finish pending writes and release the shared microphone, speaker and TTS connection
+        if 'voice_agent' in locals():
+            await voice_agent.aclose()
 
 
 async def main():
@@ -1,30 +1,199 @@
 import json
+import os
+import re
+import sys
+from functools import lru_cache
+import orjson
+from branches_manager import KeywordMatcher, NormalizedInput
+
+BRANCHES = {}
+STAGE_MATCHERS = {}
+_BRANCHES_VERSION = 0  # Bumped on reload so cached prompts from old branches are not reused
+RECENT_HISTORY_TURNS = 3  # Chat turns shown verbatim in the prompt; older ones only reach it via summary_so_far
+
+# {placeholder} names in bot prompts
+_PLACEHOLDER_RE = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)\}')
+
+# Language switch requests; the group name is the language
+_LANG_RE = re.compile(
+    r'(?P<Hindi>hindi|हिंदी|हिन्दी)|(?P<Marathi>marathi|मराठी)|(?P<Gujarati>gujarati|ગુજરાતી)',
+    re.IGNORECASE
+)
+
+# Static parts of the master prompt, identical on every turn; build_prompt appends
+# them around the per-turn fields instead of re-copying them through a template
+_PROMPT_HEAD = sys.intern("""
+You are **Veena**, a female insurance agent for ValuEnable Life Insurance. You MUST follow the conversation script EXACTLY as provided below.
+
+**STRICT INSTRUCTIONS - FOLLOW EXACTLY:**
+1. Use MAXIMUM 35 simple English words to respond
+2. ALWAYS end with a question to keep conversation flowing
+3. If customer requests different language (Hindi, Marathi, Gujarati), switch immediately
+4. FOLLOW THE CONVERSATION FLOW STRICTLY - Do not deviate from the script
+5. Use the EXACT response provided in the script for this stage
+6. Be empathetic but persistent about premium payment
+
+**MANDATORY SCRIPT TO FOLLOW:**
+Current Stage: """)
+_PROMPT_RULES = sys.intern("""
+
+**SCRIPT-BASED RESPONSE RULES:**
+- If there's an "Exact Scripted Response" above, use it WORD-FOR-WORD (just fill in customer data)
+- If only template provided, adapt it slightly but stay within 35 words
+- If user response matches expected patterns, follow the script flow exactly
+- If user mentions financial problems → suggest EMI/payment plans
+- If user is busy → offer to reschedule  
+- If user refuses → use gentle rebuttals about policy benefits
+- ALWAYS guide conversation towards payment or callback scheduling
+- DO NOT deviate from the conversation script or improvise responses
+
+**CRITICAL: You MUST follow the script exactly. If scripted response exists, use it verbatim with customer data filled in.**
+
+RESPOND EXACTLY as Veena would according to the script, then provide JSON:
+
+```json
+{
+  "intent": \"""")
+_PROMPT_FOOTER = sys.intern('",\n    "user_reason_for_non_payment": "extract_if_mentioned_in_user_input"\n  }\n}\n```')
+
+# Expected response types listed in the prompt before the rest are summarized as "(+N more)";
+# above the largest stage in branches.json (payment_inquiry, 13) so no current stage hides an option
+PROMPT_EXPECTED_RESPONSES_LIMIT = 20
+
+# Global stage overrides checked by get_next_stage ("difficult" also covers "difficulties",
+# "later" covers "call later")
+_FINANCIAL_RE = re.compile(r'financial|money|problem|issue|difficult')
+_FINANCIAL_STAGES = frozenset({"policy_confirmation", "explain_policy_loss"})
+_BUSY_RE = re.compile(r'busy|later|not good time|call back')
+
+# Stage prompts for customers who switch language
+LANGUAGE_PROMPTS = {
+    "Hindi": {
+        "greeting": "नमस्ते, मैं वीणा हूं ValuEnable Life Insurance से। क्या मैं {policy_holder_name} से बात कर सकती हूं?",
+        "closure": "अधिक जानकारी के लिए हमारी हेल्पलाइन 1800 209 7272 पर कॉल करें। धन्यवाद!"
+    },
+    "Marathi": {
+        "greeting": "नमस्कार, मी वीणा आहे ValuEnable Life Insurance कंपनीतून। मी {policy_holder_name} शी बोलू शकते का?",
+        "closure": "अधिक माहितीसाठी आमच्या हेल्पलाइनवर 1800 209 7272 वर कॉल करा। धन्यवाद!"
+    },
+    "Gujarati": {
+        "greeting": "નમસ્તે, હું વીણા છું ValuEnable Life Insurance થી। શું હું {policy_holder_name} સાથે વાત કરી શકું?",
+        "closure": "વધુ માહિતી માટે અમારી હેલ્પલાઈન 1800 209 7272 પર કોલ કરો। આભાર!"
+    }
+}
+
+# Parsed suggestions.json, re-read only when the file's mtime changes
+_SUG_CACHE = {"mtime": -1, "data": []}
+
+
+def _intern_branch_names(branches):
+    """Intern stage names, response types and next-stage references so lookups compare by pointer"""
+    interned = {}
+    for stage, branch in branches.items():
+        expected_responses = branch.get("expected_user_responses") if isinstance(branch, dict) else None
+        if isinstance(expected_responses, dict):
+            for response_data in expected_responses.values():
+                if isinstance(response_data, dict) and isinstance(response_data.get("next"), str):
+                    response_data["next"] = sys.intern(response_data["next"])
+            branch["expected_user_responses"] = {
+                sys.intern(response_type): response_data for response_type, response_data in expected_responses.items()
+            }
+        interned[sys.intern(stage)] = branch
+    return interned
+
+
+def reload_branches(path="branches.json"):
+    """Load conversation branches and precompile each stage's keyword matcher (call again to hot-reload)"""
+    global BRANCHES, STAGE_MATCHERS, _BRANCHES_VERSION
+    with open(path, 'rb') as f:
+        BRANCHES = _intern_branch_names(orjson.loads(f.read()))
+    _BRANCHES_VERSION += 1
+    STAGE_MATCHERS = {
+        stage: KeywordMatcher(branch.get("expected_user_responses"))
+        for stage, branch in BRANCHES.items() if isinstance(branch, dict)
+    }
+
 
 # Load conversation branches once
-with open("branches.json", 'r', encoding='utf-8') as f:
-    BRANCHES = json.load(f)
+reload_branches()
+
 
 def load_suggestions_context():
     """Load suggestions from suggestions.json for context"""
     try:
-        with open("suggestions.json", 'r', encoding='utf-8') as f:
-            suggestions = json.load(f)
-            return suggestions.get("pending_operations", [])
+        mtime = os.stat("suggestions.json").st_mtime_ns
+        if mtime != _SUG_CACHE["mtime"]:
+            with open("suggestions.json", 'rb') as f:
+                suggestions = orjson.loads(f.read())
+            _SUG_CACHE["data"] = suggestions.get("pending_operations", [])
+            _SUG_CACHE["mtime"] = mtime
+        return _SUG_CACHE["data"]
     except (FileNotFoundError, json.JSONDecodeError):
         return []
 
 
+@lru_cache(maxsize=512)
+def _split_template(template):
+    """Split a template into its literal chunks and the placeholder keys between them"""
+    parts = _PLACEHOLDER_RE.split(template)
+    return tuple(parts[0::2]), tuple(parts[1::2])
+
+
+# Language prompts split into literal chunks and placeholder keys once at import
+LANGUAGE_PROMPT_PARTS = {
+    (language, stage): _split_template(template)
+    for language, prompts in LANGUAGE_PROMPTS.items()
+    for stage, template in prompts.items()
+}
+
+
+def _render_parts(chunks, keys, user_data):
+    """Join pre-split template chunks with the user_data values for their placeholder keys"""
+    if not keys:
+        return chunks[0]
+    
+    # Unknown placeholders are left as-is
+    parts = [chunks[0]]
+    for key, chunk in zip(keys, chunks[1:]):
+        parts.append(str(user_data[key]) if key in user_data else "{" + key + "}")
+        parts.append(chunk)
+    return "".join(parts)
+
+
 def render_template(template: str, user_data: dict) -> str:
     """Replace placeholders in bot prompts using user_data"""
     if not template:
         return ""
-    for key, value in user_data.items():
-        template = template.replace("{" + key + "}", str(value))
-    return template
+    return _render_parts(*_split_template(template), user_data)
 
 
 def build_prompt(user_input, user_data, session_data):
-    stage = session_data.get("conversation_stage", "greeting")
+    # The template uses the language from before this turn; the JSON/customer info use the detected one
+    prompt_language = session_data.get("language_preference", "English")
+    
+    # Detect language preference
+    language_pref = detect_language_preference(user_input)
+    if language_pref != "English":
+        session_data["language_preference"] = language_pref
+
+    recent_history = tuple((turn.get("user"), turn.get("veena")) for turn in session_data.get("chat_history", [])[-RECENT_HISTORY_TURNS:])
+    cache_args = (
+        session_data.get("conversation_stage", "greeting"), user_input, recent_history,
+        prompt_language, session_data.get("language_preference", "English"),
+        session_data.get("summary_so_far"), len(load_suggestions_context()), _BRANCHES_VERSION
+    )
+    try:
+        return _build_prompt_cached(tuple(user_data.items()), *cache_args)
+    except TypeError:
+        # Unhashable user_data values (lists/dicts) can't be cached
+        return _build_prompt_cached.__wrapped__(tuple(user_data.items()), *cache_args)
+
+
+@lru_cache(maxsize=2048)
+def _build_prompt_cached(user_data_items, stage, user_input, recent_history, prompt_language, language_preference,
+                         summary_so_far, suggestions_count, branches_version):
+    """Assemble the master prompt; pure in its arguments so repeated turns are served from the cache"""
+    user_data = dict(user_data_items)
     branch = BRANCHES.get(stage, {})
     
     # If stage doesn't exist in branches, default to greeting
@@ -35,104 +204,100 @@ def build_prompt(user_input, user_data, session_data):
     bot_prompt = render_template(branch.get("bot_prompt", ""), user_data)
     
     # Check for language-specific prompt
-    language_pref = session_data.get("language_preference", "English")
-    if language_pref != "English":
-        lang_prompt = get_language_specific_prompt(stage, language_pref)
-        if lang_prompt:
-            bot_prompt = render_template(lang_prompt, user_data)
+    if prompt_language != "English":
+        lang_parts = LANGUAGE_PROMPT_PARTS.get((prompt_language, stage))
+        if lang_parts:
+            bot_prompt = _render_parts(*lang_parts, user_data)
     
     intent = branch.get("intent", "unknown_intent")
     expected_responses = branch.get("expected_user_responses", {})
 
-    # Detect language preference
-    language_pref = detect_language_preference(user_input)
-    if language_pref != "English":
-        session_data["language_preference"] = language_pref
+    # Lowercase the input once for all keyword matching below
+    normalized_input = NormalizedInput(user_input)
 
-    # Determine next stage based on user input
-    next_stage = get_next_stage(stage, user_input, user_data, session_data)
-    
-    # Get scripted response if available
-    scripted_response = get_scripted_response(stage, user_input, user_data)
+    # Determine next stage and scripted response (if available) from one keyword match
+    next_stage, scripted_response = resolve_stage_action(stage, normalized_input, user_data, None)
     if scripted_response:
         scripted_response = render_template(scripted_response, user_data)
 
     # Load Veena's suggestions context
     suggestions_context = ""
-    pending_suggestions = load_suggestions_context()
-    if pending_suggestions:
-        suggestions_context = f"\n\n**VEENA'S PENDING SUGGESTIONS (for context only):**\nVeena has suggested {len(pending_suggestions)} improvements to handle various customer scenarios better. These suggestions will be applied to the conversation flow when approved.\n"
+    if suggestions_count:
+        suggestions_context = f"\n\n**VEENA'S PENDING SUGGESTIONS (for context only):**\nVeena has suggested {suggestions_count} improvements to handle various customer scenarios better. These suggestions will be applied to the conversation flow when approved.\n"
 
     # Format recent conversation history (last 2-3 exchanges)
+    # partition stops at the first code fence instead of splitting on every one
     history_lines = []
-    recent_history = session_data.get("chat_history", [])[-3:]
-    for turn in recent_history:
-        if turn.get("user"):
-            history_lines.append(f'User: {turn["user"]}')
-        if turn.get("veena"):
-            clean_response = turn["veena"].split("```")[0].strip()
-            history_lines.append(f'Veena: {clean_response}')
+    for user_turn, veena_turn in recent_history:
+        if user_turn:
+            history_lines.append(f'User: {user_turn}')
+        if veena_turn:
+            history_lines.append(f'Veena: {veena_turn.partition("```")[0].strip()}')
     
-    conversation_history = "\n".join(history_lines) if history_lines else "No previous conversation"
-
-    # Build comprehensive master prompt
-    prompt = f"""
-You are **Veena**, a female insurance agent for ValuEnable Life Insurance. You MUST follow the conversation script EXACTLY as provided below.
-
-**STRICT INSTRUCTIONS - FOLLOW EXACTLY:**
-1. Use MAXIMUM 35 simple English words to respond
-2. ALWAYS end with a question to keep conversation flowing
-3. If customer requests different language (Hindi, Marathi, Gujarati), switch immediately
-4. FOLLOW THE CONVERSATION FLOW STRICTLY - Do not deviate from the script
-5. Use the EXACT response provided in the script for this stage
-6. Be empathetic but persistent about premium payment
-
-**MANDATORY SCRIPT TO FOLLOW:**
-Current Stage: {stage}
-Required Response Template: "{bot_prompt}"
-{f'Exact Scripted Response: "{scripted_response}"' if scripted_response else 'No specific scripted response - use template above'}
-
-**CUSTOMER INFORMATION:**
-- Name: {user_data.get('policy_holder_name', 'Sir/Madam')}
-- Policy: {user_data.get('product_name', 'Life Insurance')} (#{user_data.get('policy_number', 'N/A')})
-- Outstanding Amount: {user_data.get('outstanding_amount', 'N/A')}
-- Due Date: {user_data.get('premium_due_date', 'N/A')}
-- Language: {session_data.get('language_preference', 'English')}
-
-**CONVERSATION HISTORY:**
-{conversation_history}
-
-**USER'S CURRENT INPUT:**
-"{user_input if user_input else "Starting conversation"}"
-
-**EXPECTED USER RESPONSES FOR THIS STAGE:**
-{', '.join(expected_responses.keys()) if expected_responses else 'Any response'}{suggestions_context}
-
-**SCRIPT-BASED RESPONSE RULES:**
-- If there's an "Exact Scripted Response" above, use it WORD-FOR-WORD (just fill in customer data)
-- If only template provided, adapt it slightly but stay within 35 words
-- If user response matches expected patterns, follow the script flow exactly
-- If user mentions financial problems → suggest EMI/payment plans
-- If user is busy → offer to reschedule  
-- If user refuses → use gentle rebuttals about policy benefits
-- ALWAYS guide conversation towards payment or callback scheduling
-- DO NOT deviate from the conversation script or improvise responses
-
-**CRITICAL: You MUST follow the script exactly. If scripted response exists, use it verbatim with customer data filled in.**
-
-RESPOND EXACTLY as Veena would according to the script, then provide JSON:
-
-```json
-{{
-  "intent": "{intent}",
-  "update": {{
-    "conversation_stage": "{next_stage}",
-    "language_preference": "{session_data.get('language_preference', 'English')}",
-    "user_reason_for_non_payment": "extract_if_mentioned_in_user_input"
-  }}
-}}
-```"""
-    return prompt
+    conversation_history = "\n".join(history_lines) or "No previous conversation"
+    if summary_so_far:
+        conversation_history = f"Summary of earlier conversation: {summary_so_far}\n{conversation_history}"
+
+    # Customer fields are looked up once; the language preference is repeated in the JSON footer
+    policy_holder_name = user_data.get('policy_holder_name', 'Sir/Madam')
+    product_name = user_data.get('product_name', 'Life Insurance')
+    policy_number = user_data.get('policy_number', 'N/A')
+    outstanding_amount = user_data.get('outstanding_amount', 'N/A')
+    premium_due_date = user_data.get('premium_due_date', 'N/A')
+
+    # Build comprehensive master prompt in one join
+    parts = []
+    append = parts.append
+    append(_PROMPT_HEAD)
+    append(stage)
+    append('\nRequired Response Template: "')
+    append(bot_prompt)
+    append('"\n')
+    if scripted_response:
+        append('Exact Scripted Response: "')
+        append(scripted_response)
+        append('"')
+    else:
+        append('No specific scripted response - use template above')
+    append("\n\n**CUSTOMER INFORMATION:**\n- Name: ")
+    append(str(policy_holder_name))
+    append("\n- Policy: ")
+    append(str(product_name))
+    append(" (#")
+    append(str(policy_number))
+    append(")\n- Outstanding Amount: ")
+    append(str(outstanding_amount))
+    append("\n- Due Date: ")
+    append(str(premium_due_date))
+    append("\n- Language: ")
+    append(language_preference)
+    append("\n\n**CONVERSATION HISTORY:**\n")
+    append(conversation_history)
+    append('\n\n**USER\'S CURRENT INPUT:**\n"')
+    append(user_input if user_input else "Starting conversation")
+    append('"\n\n**EXPECTED USER RESPONSES FOR THIS STAGE:**\n')
+    append(_format_expected_responses(expected_responses))
+    append(suggestions_context)
+    append(_PROMPT_RULES)
+    append(intent)
+    append('",\n  "update": {\n    "conversation_stage": "')
+    append(next_stage)
+    append('",\n    "language_preference": "')
+    append(language_preference)
+    append(_PROMPT_FOOTER)
+    return "".join(parts)
+
+
+def _format_expected_responses(expected_responses):
+    """List a stage's expected response types, truncated so large branches don't bloat the prompt"""
+    if not expected_responses:
+        return 'Any response'
+    if len(expected_responses) <= PROMPT_EXPECTED_RESPONSES_LIMIT:
+        return ', '.join(expected_responses)
+    
+    response_types = list(expected_responses)
+    hidden = len(response_types) - PROMPT_EXPECTED_RESPONSES_LIMIT
+    return f"{', '.join(response_types[:PROMPT_EXPECTED_RESPONSES_LIMIT])}, … (+{hidden} more)"
 
 
 def get_next_stage(current_stage, user_input, user_data, session_data):
@@ -143,19 +308,16 @@ def get_next_stage(current_stage, user_input, user_data, session_data):
     branch = BRANCHES.get(current_stage, {})
     expected_responses = branch.get("expected_user_responses", {})
     
-    user_input_lower = user_input.lower() if user_input else ""
+    user_input = NormalizedInput.of(user_input)
     
     # Global checks first (these can happen from any stage)
-    if any(word in user_input_lower for word in ["financial", "money", "problem", "issue", "difficult", "difficulties"]):
-        if current_stage in ["policy_confirmation", "explain_policy_loss"]:
-            return "financial_problem_handling"
-    
-    if any(word in user_input_lower for word in ["busy", "later", "not good time", "call back", "call later"]):
-        return "check_reschedule"
+    override = get_global_stage_override(current_stage, user_input.lower)
+    if override:
+        return override
     
     # Dynamic stage determination based on keywords from branches.json
     if expected_responses:
-        best_match = find_best_response_match(user_input, expected_responses)
+        best_match = find_best_response_match(user_input, expected_responses, STAGE_MATCHERS.get(current_stage))
         if best_match:
             response_data = expected_responses[best_match]
             next_stage = response_data.get("next")
@@ -166,47 +328,50 @@ def get_next_stage(current_stage, user_input, user_data, session_data):
     return current_stage
 
 
-def detect_language_preference(user_input):
+def get_global_stage_override(current_stage, user_input_lower):
     """
-    Detect if user wants to switch language
+    Stage that applies from any point in the script (financial trouble, busy customer), or None
     """
-    if not user_input:
-        return "English"
+    if current_stage in _FINANCIAL_STAGES and _FINANCIAL_RE.search(user_input_lower):
+        return "financial_problem_handling"
     
-    user_input_lower = user_input.lower()
+    if _BUSY_RE.search(user_input_lower):
+        return "check_reschedule"
     
-    if any(word in user_input_lower for word in ["hindi", "हिंदी", "हिन्दी"]):
-        return "Hindi"
-    elif any(word in user_input_lower for word in ["marathi", "मराठी"]):
-        return "Marathi"
-    elif any(word in user_input_lower for word in ["gujarati", "ગુજરાતી"]):
-        return "Gujarati"
+    return None
+
+
+def resolve_stage_action(stage, user_input, user_data, session_data):
+    """
+    Determine both the next stage and the scripted response for a user turn
+    Runs the keyword match against the stage's expected responses only once
+    """
+    branch = BRANCHES.get(stage, {})
+    expected_responses = branch.get("expected_user_responses", {})
+    user_input = NormalizedInput.of(user_input)
     
-    return "English"
+    best_match = None
+    if expected_responses:
+        best_match = find_best_response_match(user_input, expected_responses, STAGE_MATCHERS.get(stage))
+    response_data = expected_responses[best_match] if best_match else {}
+    
+    next_stage = get_global_stage_override(stage, user_input.lower) or response_data.get("next") or stage
+    return next_stage, response_data.get("response") or None
+
+
+def detect_language_preference(user_input):
+    """
+    Detect if user wants to switch language
+    """
+    match = _LANG_RE.search(user_input or "")
+    return match.lastgroup if match else "English"
 
 
 def get_language_specific_prompt(stage, language="English"):
     """
     Get stage-specific prompts in different languages
     """
-    language_prompts = {
-        "Hindi": {
-            "greeting": "नमस्ते, मैं वीणा हूं ValuEnable Life Insurance से। क्या मैं {policy_holder_name} से बात कर सकती हूं?",
-            "closure": "अधिक जानकारी के लिए हमारी हेल्पलाइन 1800 209 7272 पर कॉल करें। धन्यवाद!"
-        },
-        "Marathi": {
-            "greeting": "नमस्कार, मी वीणा आहे ValuEnable Life Insurance कंपनीतून। मी {policy_holder_name} शी बोलू शकते का?",
-            "closure": "अधिक माहितीसाठी आमच्या हेल्पलाइनवर 1800 209 7272 वर कॉल करा। धन्यवाद!"
-        },
-        "Gujarati": {
-            "greeting": "નમસ્તે, હું વીણા છું ValuEnable Life Insurance થી। શું હું {policy_holder_name} સાથે વાત કરી શકું?",
-            "closure": "વધુ માહિતી માટે અમારી હેલ્પલાઈન 1800 209 7272 પર કોલ કરો। આભાર!"
-        }
-    }
-    
-    if language in language_prompts and stage in language_prompts[language]:
-        return language_prompts[language][stage]
-    return None
+    return LANGUAGE_PROMPTS.get(language, {}).get(stage)
 
 
 def get_scripted_response(current_stage, user_input, user_data):
@@ -220,10 +385,8 @@ def get_scripted_response(current_stage, user_input, user_data):
     if not expected_responses:
         return None
     
-    user_input_lower = user_input.lower() if user_input else ""
-    
     # Use the improved matching algorithm
-    best_match = find_best_response_match(user_input, expected_responses)
+    best_match = find_best_response_match(user_input, expected_responses, STAGE_MATCHERS.get(current_stage))
     
     if best_match:
         response_data = expected_responses[best_match]
@@ -236,40 +399,46 @@ def get_scripted_response(current_stage, user_input, user_data):
 
 def score_keyword_match(user_input_lower, keywords):
     """
-    Calculate a matching score based on how many keywords match
+    Calculate a matching score based on how many (already lowercased) keywords match
     Returns the number of matched keywords and total keyword count
     """
     if not keywords:
         return 0, 0
     
-    matched_keywords = sum(1 for keyword in keywords if keyword.lower() in user_input_lower)
+    matched_keywords = sum(1 for keyword in keywords if keyword in user_input_lower)
     return matched_keywords, len(keywords)
 
 
-def find_best_response_match(user_input, expected_responses):
+def find_best_response_match(user_input, expected_responses, matcher=None):
     """
     Find the best matching response based on keyword scoring
     Returns the response_type with highest match score
     """
-    if not expected_responses or not user_input:
+    user_input = NormalizedInput.of(user_input)
+    if not expected_responses or not user_input.raw:
         return None
-        
-    user_input_lower = user_input.lower()
+    
+    if matcher is None:
+        matcher = KeywordMatcher(expected_responses)
+    
+    # One regex pass rules out inputs that contain no keyword at all
+    user_input_lower = user_input.lower
+    if not matcher.has_any_keyword(user_input_lower):
+        return None
+    
     best_match = None
     best_score = 0
     best_ratio = 0
     
-    for response_type, response_data in expected_responses.items():
-        keywords = response_data.get("keywords", [])
-        if keywords:
-            matched_count, total_count = score_keyword_match(user_input_lower, keywords)
-            match_ratio = matched_count / total_count if total_count > 0 else 0
-            
-            # Prioritize by number of matched keywords, then by match ratio
-            if matched_count > best_score or (matched_count == best_score and match_ratio > best_ratio):
-                best_match = response_type
-                best_score = matched_count
-                best_ratio = match_ratio
+    for response_type, keywords in matcher.entries:
+        matched_count, total_count = score_keyword_match(user_input_lower, keywords)
+        match_ratio = matched_count / total_count if total_count > 0 else 0
+        
+        # Prioritize by number of matched keywords, then by match ratio
+        if matched_count > best_score or (matched_count == best_score and match_ratio > best_ratio):
+            best_match = response_type
+            best_score = matched_count
+            best_ratio = match_ratio
     
     return best_match if best_score > 0 else None
 
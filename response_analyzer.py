@@ -2,10 +2,114 @@
 Response Analysis Module
 Handles response matching, branch detection, and conversation flow analysis
 """
-import json
 import re
-from typing import Dict, Any, Optional, Tuple
-from branches_manager import BranchesManager
+import orjson
+from collections import Counter
+from typing import Dict, Any, FrozenSet, Optional, Tuple, Union
+from branches_manager import BranchesManager, NormalizedInput
+
+# Fenced JSON metadata block at the end of an LLM response
+_JSON_BLOCK_RE = re.compile(r'```json\s*\n({.*?})\s*\n```', re.DOTALL)
+
+# Generic yes/no phrases used for expected responses that define no keywords
+GENERIC_PATTERNS = {
+    "yes": ["yes", "ok", "okay", "fine", "sure", "correct", "right", "speaking", "this is", "i am", "yeah", "yep", "alright", "absolutely", "go ahead", "proceed", "continue", "right time"],
+    "no": ["no", "not", "nope", "wrong", "incorrect", "not me", "not here", "not available", "not now", "later", "busy", "not good time", "call back"],
+}
+GENERIC_PATTERN_RES = {
+    response_type: re.compile("|".join(map(re.escape, patterns)))
+    for response_type, patterns in GENERIC_PATTERNS.items()
+}
+
+# Keywords each fallback branch listens for in find_appropriate_existing_branch
+BRANCH_KEYWORDS = {
+    # Payment related responses
+    "payment_followup": ["pay", "payment", "how to pay", "money", "card", "online", "upi", "cheque", "cost", "amount"],
+    "payment_inquiry": ["can't pay", "financial problem", "difficult", "expensive", "broke", "budget", "tight"],
+    "payment_already_made": ["already paid", "paid", "done", "completed", "cleared", "settled"],
+    
+    # Policy information requests
+    "policy_confirmation": ["policy details", "what policy", "my policy", "benefits", "coverage", "details"],
+    "explain_policy_loss": ["what happens", "benefits", "importance", "why", "explain", "understand"],
+    
+    # Financial concerns and objections
+    "financial_problem_handling": ["money problem", "financial", "afford", "crisis", "expensive"],
+    "rebuttals": ["not interested", "don't want", "refuse", "won't pay", "cancel"],
+    
+    # Scheduling and timing - reschedule_callback has higher priority than schedule_callback
+    "reschedule_callback": ["can we speak", "speak tomorrow", "speak later", "call later", "not now", "busy", "different time", "another time", "reschedule", "not good time"],
+    "schedule_callback": ["tomorrow", "next week", "evening", "morning", "weekend"],
+    
+    # Alternative scenarios
+    "scenario_market_high": ["market", "volatile", "risky", "unstable"],
+    "scenario_emergency_needs": ["emergency", "medical", "urgent", "hospital"],
+    "scenario_better_alternatives": ["mutual fund", "fd", "better option", "alternative"],
+    "scenario_low_returns": ["poor returns", "low returns", "loss", "not profitable"],
+    
+    # Help and clarification
+    "general_help": ["help", "confused", "don't understand", "explain", "clarify"],
+    "policy_bond_help": ["policy document", "bond", "papers", "certificate"],
+    
+    # Default fallbacks
+    "default_fallback": ["unclear", "other", "different"],
+    "unexpected_response_handler": ["specific concern", "elaborate", "discuss"]
+}
+
+# Common typos and phrasings that also count as a branch keyword
+KEYWORD_VARIANTS = {
+    "schedule_callback": {
+        "tomorrow": ["tommorow", "tomorow", "tomorrrow", "tommorrow"],
+        "evening": ["evenig", "evning", "eveng"],
+        "morning": ["mornig", "morng", "moring"]
+    },
+    "reschedule_callback": {
+        "speak tomorrow": ["speak tommorow", "speak tomorow", "talk tomorrow", "talk tommorow"],
+        "can we speak": ["can we talk", "could we speak", "could we talk"],
+        "call back": ["callback", "call-back", "call me back", "call later"],
+        "different time": ["other time", "another time", "diff time"]
+    }
+}
+KEYWORD_VARIANT_RES = {
+    branch_name: {keyword: re.compile("|".join(map(re.escape, variants))) for keyword, variants in variants_by_keyword.items()}
+    for branch_name, variants_by_keyword in KEYWORD_VARIANTS.items()
+}
+
+# Keyword -> branches listing it, with the typo variants that also count for a branch,
+# so each distinct keyword is tested once per input instead of once per branch
+BRANCH_KEYWORD_INDEX = {}
+for _branch_name, _keywords in BRANCH_KEYWORDS.items():
+    for _keyword in _keywords:
+        _owners, _variants = BRANCH_KEYWORD_INDEX.setdefault(_keyword, ([], []))
+        _owners.append(_branch_name)
+        if _keyword in KEYWORD_VARIANT_RES.get(_branch_name, {}):
+            _variants.append((_branch_name, KEYWORD_VARIANT_RES[_branch_name][_keyword]))
+del _branch_name, _keywords, _keyword, _owners, _variants
+
+# One pass over the input rules out every branch when no keyword or variant occurs at all
+ANY_BRANCH_KEYWORD_RE = re.compile("|".join(map(re.escape, sorted(
+    set(BRANCH_KEYWORD_INDEX)
+    | {v for variants_by_keyword in KEYWORD_VARIANTS.values() for variants in variants_by_keyword.values() for v in variants},
+    key=len, reverse=True
+))))
+
+# Generic affirmatives are mapped by stage; generic negatives always mean reschedule
+GENERIC_AFFIRMATIVE_RE = re.compile("|".join(map(re.escape, ["sure", "okay", "alright", "fine", "proceed", "continue", "go ahead"])))
+GENERIC_NEGATIVE_RE = re.compile("|".join(map(re.escape, ["nah", "nope", "not really", "not now", "maybe not"])))
+AFFIRMATIVE_CONTEXT_MAPPINGS = {
+    "policy_status_explanation": ("wants_to_know_importance", 0.8, "User agrees to hear more explanation"),
+    "explain_policy_loss": ("wants_payment_options", 0.8, "After explanation, user typically wants payment options"),
+    "payment_followup": ("online", 0.7, "Generic agreement in payment context usually means online payment"),
+    "policy_confirmation": ("confirms_basic_details", 0.8, "Generic agreement to policy details"),
+    "general_help": ("policy_benefits", 0.7, "Generic agreement to help usually means wanting to know benefits"),
+    "rebuttals": ("wants_payment_options", 0.7, "After rebuttals, user agreeing usually means ready to pay")
+}
+
+# "No questions" in policy_status_explanation means the customer wants to proceed
+NO_QUESTIONS_RE = re.compile("|".join(map(re.escape, [
+    "no questions", "dont have questions", "don't have questions",
+    "no i dont have questions", "no i don't have questions",
+    "i dont have questions", "i don't have questions"
+])))
 
 
 class ResponseAnalyzer:
@@ -17,27 +121,23 @@ class ResponseAnalyzer:
     def extract_metadata(self, response: str) -> Dict[str, Any]:
         """Extract JSON metadata from response"""
         try:
-            match = re.search(r'```json\n({.*?})\n```', response, re.DOTALL)
+            match = _JSON_BLOCK_RE.search(response)
             if match:
-                return json.loads(match.group(1))
+                return orjson.loads(match.group(1))
         except Exception as e:
             print(f"JSON extraction error: {e}")
         return {}
     
     def fix_currency_formatting(self, text: str) -> str:
         """Fix double rupee symbol issue and other currency formatting problems"""
-        if not text:
+        # Most responses are already clean, so skip the replace scan entirely
+        if not text or "₹₹" not in text:
             return text
         
         # Replace ₹₹ with ₹
-        text = re.sub(r'₹₹', '₹', text)
-        
-        # Ensure proper spacing around currency
-        text = re.sub(r'₹(\d)', r'₹\1', text)
-        
-        return text
+        return text.replace("₹₹", "₹")
     
-    def check_if_response_matches_expected(self, user_input: str, current_stage: str) -> Tuple[bool, Optional[str], Optional[str], Optional[str]]:
+    def check_if_response_matches_expected(self, user_input: Union[str, NormalizedInput], current_stage: str) -> Tuple[bool, Optional[str], Optional[str], Optional[str]]:
         """
         Check if user input matches any expected response pattern for the current stage.
         Returns (matches, matched_response_type, scripted_response, next_stage)
@@ -50,59 +150,36 @@ class ResponseAnalyzer:
         if not expected_responses:
             return False, None, None, None
         
-        user_input_lower = user_input.lower() if user_input else ""
+        normalized_input = NormalizedInput.of(user_input)
+        user_input, user_input_lower = normalized_input.raw, normalized_input.lower
         
         print(f"🔍 DEBUG: Looking for matches in expected responses: {list(expected_responses.keys())}")
         
-        # STEP 1: Check direct keyword matches from branches.json
-        for response_type, response_data in expected_responses.items():
-            keywords = response_data.get("keywords", [])
-            if keywords:
-                print(f"🔍 DEBUG: Checking {response_type} with keywords: {keywords}")
+        # STEP 1: Check direct keyword matches from branches.json (skipped when no keyword occurs at all)
+        matcher = self.branches_manager.get_keyword_matcher(current_stage)
+        if matcher.has_any_keyword(user_input_lower):
+            negated = matcher.negated_keywords(user_input_lower)
+            for response_type, keywords in matcher.entries:
+                print(f"🔍 DEBUG: Checking {response_type} with keywords: {list(keywords)}")
                 # Check if any keyword matches the user input
                 for keyword in keywords:
-                    if keyword.lower() in user_input_lower:
-                        # Check for negations before confirming match
-                        negation_patterns = [
-                            f"no {keyword.lower()}",
-                            f"don't {keyword.lower()}",
-                            f"dont {keyword.lower()}",
-                            f"not {keyword.lower()}",
-                            f"no i don't {keyword.lower()}",
-                            f"no i dont {keyword.lower()}",
-                            f"i don't {keyword.lower()}",
-                            f"i dont {keyword.lower()}",
-                            f"i don't have {keyword.lower()}",
-                            f"i dont have {keyword.lower()}",
-                            f"no i don't have {keyword.lower()}",
-                            f"no i dont have {keyword.lower()}"
-                        ]
-                        
+                    if keyword in user_input_lower:
                         # If user is negating the keyword, skip this match
-                        if any(neg_pattern in user_input_lower for neg_pattern in negation_patterns):
+                        if keyword in negated:
                             print(f"❌ NEGATION DETECTED: '{keyword}' found but negated in '{user_input}'")
                             continue
                         
                         print(f"✅ KEYWORD MATCH: '{keyword}' found in '{user_input}'")
+                        response_data = expected_responses[response_type]
                         return True, response_type, response_data.get("response"), response_data.get("next")
         
         # STEP 2: Fallback to generic patterns for responses without keywords
-        generic_patterns = {
-            "yes": ["yes", "ok", "okay", "fine", "sure", "correct", "right", "speaking", "this is", "i am", "yeah", "yep", "alright", "absolutely", "go ahead", "proceed", "continue", "right time"],
-            "no": ["no", "not", "nope", "wrong", "incorrect", "not me", "not here", "not available", "not now", "later", "busy", "not good time", "call back"],
-        }
-        
         print(f"🔍 DEBUG: No keyword matches found, checking generic patterns")
         
         # STEP 2.5: Special case handling for negated responses
         # "no questions" or "don't have questions" in policy_status_explanation should be treated as "wants_to_proceed"
         if current_stage == "policy_status_explanation":
-            no_questions_patterns = [
-                "no questions", "dont have questions", "don't have questions", 
-                "no i dont have questions", "no i don't have questions",
-                "i dont have questions", "i don't have questions"
-            ]
-            if any(pattern in user_input_lower for pattern in no_questions_patterns):
+            if NO_QUESTIONS_RE.search(user_input_lower):
                 print(f"🎯 SPECIAL CASE: 'no questions' in policy_status_explanation treated as 'wants_to_proceed'")
                 if "wants_to_proceed" in expected_responses:
                     return True, "wants_to_proceed", expected_responses["wants_to_proceed"].get("response"), expected_responses["wants_to_proceed"].get("next")
@@ -111,35 +188,51 @@ class ResponseAnalyzer:
         for response_type, response_data in expected_responses.items():
             # Only use generic patterns if no keywords are defined
             if not response_data.get("keywords"):
-                if response_type in generic_patterns:
-                    print(f"🔍 DEBUG: Checking generic pattern {response_type}: {generic_patterns[response_type]}")
-                    if any(pattern in user_input_lower for pattern in generic_patterns[response_type]):
+                if response_type in GENERIC_PATTERN_RES:
+                    print(f"🔍 DEBUG: Checking generic pattern {response_type}: {GENERIC_PATTERNS[response_type]}")
+                    if GENERIC_PATTERN_RES[response_type].search(user_input_lower):
                         print(f"✅ GENERIC MATCH: '{response_type}' pattern matched")
                         return True, response_type, response_data.get("response"), response_data.get("next")
         
         return False, None, None, None
     
-    def find_appropriate_existing_branch(self, user_input: str, current_stage: str) -> Tuple[Optional[str], float]:
+    def get_scripted_reply(self, user_input: Union[str, NormalizedInput], current_stage: str,
+                           closure_stages: FrozenSet[str] = frozenset()) -> Optional[Tuple[str, str, Optional[str]]]:
+        """
+        Reply straight from the script: the matched response's scripted line, else the next branch's bot_prompt.
+        Returns (matched_response_type, bot_response, next_stage), or None if nothing usable matched.
+        A move into a closure stage without a scripted line also returns None, since the closure
+        handling speaks and records that branch's bot_prompt itself.
+        """
+        matches_expected, matched_type, scripted_response, next_stage = self.check_if_response_matches_expected(
+            user_input, current_stage
+        )
+        if not matches_expected:
+            return None
+        
+        bot_response = scripted_response
+        if not bot_response and next_stage:
+            if next_stage in closure_stages:
+                return None
+            next_branch = self.branches_manager.read_branch(next_stage)
+            bot_response = next_branch.get("bot_prompt") if next_branch else None
+        if not bot_response:
+            return None
+        
+        return matched_type, bot_response, next_stage
+    
+    def find_appropriate_existing_branch(self, user_input: Union[str, NormalizedInput], current_stage: str) -> Tuple[Optional[str], float]:
         """
         Try to find an existing branch that could handle this unexpected response.
         Returns (branch_name, confidence_score) or (None, 0) if no good match found.
         """
-        user_input_lower = user_input.lower() if user_input else ""
+        normalized_input = NormalizedInput.of(user_input)
+        user_input, user_input_lower = normalized_input.raw, normalized_input.lower
         
         # STEP 1: Handle generic affirmative responses based on context
-        generic_affirmatives = ["sure", "okay", "alright", "fine", "proceed", "continue", "go ahead"]
-        if any(word in user_input_lower for word in generic_affirmatives):
-            context_mappings = {
-                "policy_status_explanation": ("wants_to_know_importance", 0.8, "User agrees to hear more explanation"),
-                "explain_policy_loss": ("wants_payment_options", 0.8, "After explanation, user typically wants payment options"),
-                "payment_followup": ("online", 0.7, "Generic agreement in payment context usually means online payment"),
-                "policy_confirmation": ("confirms_basic_details", 0.8, "Generic agreement to policy details"),
-                "general_help": ("policy_benefits", 0.7, "Generic agreement to help usually means wanting to know benefits"),
-                "rebuttals": ("wants_payment_options", 0.7, "After rebuttals, user agreeing usually means ready to pay")
-            }
-            
-            if current_stage in context_mappings:
-                target_branch, confidence, reasoning = context_mappings[current_stage]
+        if GENERIC_AFFIRMATIVE_RE.search(user_input_lower):
+            if current_stage in AFFIRMATIVE_CONTEXT_MAPPINGS:
+                target_branch, confidence, reasoning = AFFIRMATIVE_CONTEXT_MAPPINGS[current_stage]
                 # Check if the target branch actually exists in the current stage's expected responses
                 current_branch = self.branches_manager.read_branch(current_stage)
                 if current_branch and target_branch in current_branch.get("expected_user_responses", {}):
@@ -148,83 +241,37 @@ class ResponseAnalyzer:
                     return target_branch, confidence
         
         # STEP 2: Handle generic negative responses
-        generic_negatives = ["nah", "nope", "not really", "not now", "maybe not"]
-        if any(word in user_input_lower for word in generic_negatives):
+        if GENERIC_NEGATIVE_RE.search(user_input_lower):
             # These typically map to 'no' responses or scheduling
             return "reschedule", 0.6
         
         # STEP 3: Standard keyword-based mapping
-        branch_mappings = {
-            # Payment related responses
-            "payment_followup": ["pay", "payment", "how to pay", "money", "card", "online", "upi", "cheque", "cost", "amount"],
-            "payment_inquiry": ["can't pay", "financial problem", "difficult", "expensive", "broke", "budget", "tight"],
-            "payment_already_made": ["already paid", "paid", "done", "completed", "cleared", "settled"],
-            
-            # Policy information requests
-            "policy_confirmation": ["policy details", "what policy", "my policy", "benefits", "coverage", "details"],
-            "explain_policy_loss": ["what happens", "benefits", "importance", "why", "explain", "understand"],
-            
-            # Financial concerns and objections
-            "financial_problem_handling": ["money problem", "financial", "afford", "crisis", "expensive"],
-            "rebuttals": ["not interested", "don't want", "refuse", "won't pay", "cancel"],
-            
-            # Scheduling and timing - reschedule_callback has higher priority than schedule_callback
-            "reschedule_callback": ["can we speak", "speak tomorrow", "speak later", "call later", "not now", "busy", "different time", "another time", "reschedule", "not good time"],
-            "schedule_callback": ["tomorrow", "next week", "evening", "morning", "weekend"],
-            
-            # Alternative scenarios
-            "scenario_market_high": ["market", "volatile", "risky", "unstable"],
-            "scenario_emergency_needs": ["emergency", "medical", "urgent", "hospital"],
-            "scenario_better_alternatives": ["mutual fund", "fd", "better option", "alternative"],
-            "scenario_low_returns": ["poor returns", "low returns", "loss", "not profitable"],
-            
-            # Help and clarification
-            "general_help": ["help", "confused", "don't understand", "explain", "clarify"],
-            "policy_bond_help": ["policy document", "bond", "papers", "certificate"],
-            
-            # Default fallbacks
-            "default_fallback": ["unclear", "other", "different"],
-            "unexpected_response_handler": ["specific concern", "elaborate", "discuss"]
-        }
-        
         best_match = None
         highest_score = 0
+        if not ANY_BRANCH_KEYWORD_RE.search(user_input_lower):
+            return None, 0
+        
+        # Count keyword hits per branch, testing each distinct keyword once
+        # (with fuzzy matching for common typos)
+        branch_matches = Counter()
+        for keyword, (owners, variants) in BRANCH_KEYWORD_INDEX.items():
+            if keyword in user_input_lower:
+                branch_matches.update(owners)
+            else:
+                for branch_name, variant_re in variants:
+                    if variant_re.search(user_input_lower):
+                        branch_matches[branch_name] += 1
         
-        for branch_name, keywords in branch_mappings.items():
+        for branch_name, keywords in BRANCH_KEYWORDS.items():
+            matches = branch_matches[branch_name]
             # Skip current stage to avoid loops
-            if branch_name == current_stage:
+            if not matches or branch_name == current_stage:
                 continue
                 
             # Check if branch exists
             if not self.branches_manager.read_branch(branch_name):
                 continue
                 
-            # Calculate match score with fuzzy matching for common typos
-            matches = 0
-            for keyword in keywords:
-                if keyword in user_input_lower:
-                    matches += 1
-                # Handle common typos and variations for scheduling keywords
-                elif branch_name == "schedule_callback":
-                    # Common typos for "tomorrow"
-                    if keyword == "tomorrow" and any(variant in user_input_lower for variant in ["tommorow", "tomorow", "tomorrrow", "tommorrow"]):
-                        matches += 1
-                    # Variations for "evening"  
-                    elif keyword == "evening" and any(variant in user_input_lower for variant in ["evenig", "evning", "eveng"]):
-                        matches += 1
-                    # Variations for "morning"
-                    elif keyword == "morning" and any(variant in user_input_lower for variant in ["mornig", "morng", "moring"]):
-                        matches += 1
-                # Handle reschedule_callback variations
-                elif branch_name == "reschedule_callback":
-                    if keyword == "speak tomorrow" and any(variant in user_input_lower for variant in ["speak tommorow", "speak tomorow", "talk tomorrow", "talk tommorow"]):
-                        matches += 1
-                    elif keyword == "can we speak" and any(variant in user_input_lower for variant in ["can we talk", "could we speak", "could we talk"]):
-                        matches += 1
-                    elif keyword == "call back" and any(variant in user_input_lower for variant in ["callback", "call-back", "call me back", "call later"]):
-                        matches += 1
-                    elif keyword == "different time" and any(variant in user_input_lower for variant in ["other time", "another time", "diff time"]):
-                        matches += 1
             if matches > 0:
                 # Score based on keyword matches and keyword specificity
                 base_score = matches / len(keywords)
@@ -2,25 +2,119 @@
 Session Management Module
 Handles session data loading, saving, and user data management
 """
-import json
-from typing import Dict, Any, Optional
+import atexit
+import time
+import orjson
+from typing import Dict, Any, Optional, Tuple
 import os
 
+from file_utils import atomic_write
+
+# Marks data that hasn't been read from disk yet
+_UNSET = object()
+
+# Stages that end the conversation
+_CLOSURE_BRANCHES = frozenset({
+    "closure",
+    "payment_success_closure",
+    "complaint_resolution_closure",
+    "schedule_callback"
+})
+
+# Initial session state; chat_history gets a fresh list per session in _new_session_data()
+_DEFAULT_SESSION = {
+    "conversation_stage": "greeting",
+    "language_preference": "English",
+    "user_agreed_to_pay": None,
+    "callback_scheduled": False,
+    "chat_history": [],
+    "last_intent": None
+}
+
+
+def _new_session_data() -> Dict[str, Any]:
+    """Copy of the default session with its own chat history list"""
+    return dict(_DEFAULT_SESSION, chat_history=[])
+
 
 class SessionManager:
     """Manages session data and user data for the conversation agent"""
     
-    def __init__(self, user_data_file: str = "user_data.json", session_data_file: str = "session_data.json"):
+    def __init__(self, user_data_file: str = "user_data.json", session_data_file: str = "session_data.json",
+                 flush_interval: float = 2.0):
         self.user_data_file = user_data_file
         self.session_data_file = session_data_file
-        self.user_data = self._load_user_data()
-        self.session_data = self._load_session_data()
+        # Chat turns are appended here as NDJSON so a save doesn't rewrite the whole transcript
+        self.chat_history_file = os.path.splitext(session_data_file)[0] + "_chat_history.ndjson"
+        self._persisted_turns = 0
+        self._history_stale = True
+        # Saves within flush_interval seconds of the last write are coalesced into the next one
+        self.flush_interval = flush_interval
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush, True)
+        # Each file is parsed on first access, so callers that only need one skip the other
+        self._user_data = _UNSET
+        self._session_data = _UNSET
+        # mtime of the session file when it was last read or written, to skip reparsing it unchanged
+        self._session_mtime = None
+    
+    @property
+    def user_data(self) -> Dict[str, Any]:
+        """Static user data, loaded on first access"""
+        if self._user_data is _UNSET:
+            self._user_data = self._load_user_data()
+        return self._user_data
+    
+    @user_data.setter
+    def user_data(self, value: Dict[str, Any]) -> None:
+        self._user_data = value
+    
+    @property
+    def session_data(self) -> Dict[str, Any]:
+        """Session data, loaded on first access"""
+        if self._session_data is _UNSET:
+            self._maybe_reload_session()
+        return self._session_data
+    
+    @session_data.setter
+    def session_data(self, value: Dict[str, Any]) -> None:
+        # Loaded and default sessions always carry chat_history; assigned ones get it here once
+        value.setdefault("chat_history", [])
+        self._session_data = value
+        # A replaced session has to rewrite the chat history file, not append to it
+        self._history_stale = True
+    
+    def _session_file_mtime(self) -> Optional[int]:
+        """Modification time of the session file in nanoseconds, None if it doesn't exist"""
+        try:
+            return os.stat(self.session_data_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _maybe_reload_session(self) -> None:
+        """(Re)load session data unless the file is unchanged since it was last read or written"""
+        if self._session_data is _UNSET:
+            self._session_mtime = self._session_file_mtime()
+            self._session_data = self._load_session_data()
+            return
+        
+        if self._dirty:
+            return  # Unsaved in-memory changes take precedence over the file
+        mtime = self._session_file_mtime()
+        if mtime == self._session_mtime:
+            return
+        # Reload in place so callers holding the session dict keep seeing the live data
+        loaded = self._load_session_data()
+        self._session_data.clear()
+        self._session_data.update(loaded)
+        self._session_mtime = mtime
     
     def _load_user_data(self) -> Dict[str, Any]:
         """Load static user data"""
         try:
-            with open(self.user_data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(self.user_data_file, 'rb') as f:
+                return orjson.loads(f.read())
         except FileNotFoundError:
             print(f"Warning: {self.user_data_file} not found, using empty user data")
             return {}
@@ -28,42 +122,113 @@ class SessionManager:
     def _load_session_data(self) -> Dict[str, Any]:
         """Load or initialize session data"""
         try:
-            with open(self.session_data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(self.session_data_file, 'rb') as f:
+                session_data = orjson.loads(f.read())
+        except FileNotFoundError:
+            self._history_stale = True
+            return _new_session_data()
+        
+        # Files written by the customer managers (or full snapshots) carry their own chat history;
+        # state files written by save_session keep it in the NDJSON file instead
+        if "chat_history" in session_data:
+            self._history_stale = True
+            return session_data
+        
+        chat_history = []
+        try:
+            with open(self.chat_history_file, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        chat_history.append(orjson.loads(line))
         except FileNotFoundError:
-            return {
-                "conversation_stage": "greeting",
-                "language_preference": "English",
-                "user_agreed_to_pay": None,
-                "callback_scheduled": False,
-                "chat_history": [],
-                "last_intent": None
-            }
+            pass
+        session_data["chat_history"] = chat_history
+        self._persisted_turns = len(chat_history)
+        self._history_stale = False
+        return session_data
     
-    def save_session(self) -> bool:
-        """Save session data to file"""
+    def dump_session(self) -> bytes:
+        """Serialize session data to UTF-8 JSON bytes"""
+        return orjson.dumps(self.session_data, option=orjson.OPT_INDENT_2)
+    
+    def dump_state(self) -> bytes:
+        """Serialize session data without the chat history to UTF-8 JSON bytes"""
+        state = {key: value for key, value in self.session_data.items() if key != "chat_history"}
+        return orjson.dumps(state, option=orjson.OPT_INDENT_2)
+    
+    def collect_pending_writes(self, force: bool = False) -> Optional[Tuple[bool, bytes, bytes]]:
+        """
+        Serialize what a flush would write: (rewrite_history, chat_history_bytes, state_bytes).
+        Returns None if nothing changed or the flush interval hasn't passed (unless force is set).
+        The result can be written later, e.g. on a writer thread, with write_pending().
+        """
+        if not self._dirty or (not force and time.monotonic() - self._last_flush < self.flush_interval):
+            return None
+        
+        # Append only the turns added since the last write, unless the history was replaced
+        chat_history = self.session_data.get("chat_history", [])
+        rewrite_history = self._history_stale or len(chat_history) < self._persisted_turns
+        new_turns = chat_history if rewrite_history else chat_history[self._persisted_turns:]
+        history_bytes = b"".join(orjson.dumps(turn) + b"\n" for turn in new_turns)
+        
+        self._persisted_turns = len(chat_history)
+        self._history_stale = False
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        return rewrite_history, history_bytes, self.dump_state()
+    
+    def write_pending(self, pending: Tuple[bool, bytes, bytes]) -> bool:
+        """Write the output of collect_pending_writes(): chat turns first, then the state file"""
+        rewrite_history, history_bytes, state_bytes = pending
         try:
-            with open(self.session_data_file, 'w', encoding='utf-8') as f:
-                json.dump(self.session_data, f, indent=4)
-            return True
+            # History first, so a state file without chat_history always has its turns on disk
+            if rewrite_history:
+                atomic_write(self.chat_history_file, history_bytes)
+            elif history_bytes:
+                with open(self.chat_history_file, 'ab') as f:
+                    f.write(history_bytes)
+            atomic_write(self.session_data_file, state_bytes)
+            self._session_mtime = self._session_file_mtime()
         except Exception as e:
             print(f"Error saving session: {e}")
+            # Rewrite everything on the next flush rather than guess what reached the disk
+            self._history_stale = True
+            self._dirty = True
             return False
+        return True
+    
+    def flush(self, force: bool = False) -> bool:
+        """Write session data if it changed and the flush interval has passed (or force is set)"""
+        pending = self.collect_pending_writes(force)
+        return pending is None or self.write_pending(pending)
+    
+    def save_session(self) -> bool:
+        """Save session data to file; saves arriving within the flush interval are batched"""
+        self._dirty = True
+        return self.flush()
+    
+    def close(self) -> None:
+        """Write any pending changes now and drop the exit-time flush (call before removing session files)"""
+        self.flush(force=True)
+        atexit.unregister(self.flush)
     
     def update_session(self, updates: Dict[str, Any]) -> None:
         """Update session data with new values"""
         for key, value in updates.items():
             self.session_data[key] = value
+        self._dirty = True
     
     def add_to_chat_history(self, user_input: Optional[str], bot_response: str) -> None:
         """Add conversation turn to chat history"""
-        self.session_data.setdefault("chat_history", []).append({
+        self.session_data["chat_history"].append({
             "user": user_input,
             "veena": bot_response
         })
+        self._dirty = True
     
     def get_session_data(self) -> Dict[str, Any]:
-        """Get current session data"""
+        """Get current session data, re-reading the file only if it changed on disk"""
+        self._maybe_reload_session()
         return self.session_data
     
     def get_user_data(self) -> Dict[str, Any]:
@@ -72,14 +237,7 @@ class SessionManager:
     
     def is_conversation_complete(self) -> bool:
         """Check if conversation is in any closure stage"""
-        current_stage = self.session_data.get("conversation_stage", "greeting")
-        closure_branches = {
-            "closure", 
-            "payment_success_closure", 
-            "complaint_resolution_closure", 
-            "schedule_callback"
-        }
-        return current_stage in closure_branches
+        return self.session_data.get("conversation_stage", "greeting") in _CLOSURE_BRANCHES
     
     def get_current_stage(self) -> str:
         """Get current conversation stage"""
@@ -89,8 +247,7 @@ class SessionManager:
         """Create a backup of current session data"""
         try:
             backup_filename = self.session_data_file.replace('.json', f'{backup_suffix}.json')
-            with open(backup_filename, 'w', encoding='utf-8') as f:
-                json.dump(self.session_data, f, indent=4)
+            atomic_write(backup_filename, self.dump_session())
             return True
         except Exception as e:
             print(f"Error creating session backup: {e}")
@@ -98,11 +255,5 @@ class SessionManager:
     
     def reset_session(self) -> None:
         """Reset session data to initial state"""
-        self.session_data = {
-            "conversation_stage": "greeting",
-            "language_preference": "English", 
-            "user_agreed_to_pay": None,
-            "callback_scheduled": False,
-            "chat_history": [],
-            "last_intent": None
-        }
+        self.session_data = _new_session_data()
+        self._dirty = True
@@ -20,22 +20,36 @@ def install_requirements():
     print("\n📦 Installing required packages...")
     try:
         import subprocess
-        result = subprocess.run([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"], 
-                              capture_output=True, text=True)
+        # pip writes straight to the terminal (errors included) instead of being buffered here
+        result = subprocess.run([sys.executable, "-m", "pip", "install", "-q", "-r", "requirements.txt"])
         if result.returncode == 0:
             print("✅ All packages installed successfully")
             return True
         else:
-            print(f"❌ Package installation failed: {result.stderr}")
+            print(f"❌ Package installation failed (pip exited with code {result.returncode})")
             return False
     except Exception as e:
         print(f"❌ Error installing packages: {e}")
         return False
 
-def check_env_file():
+def scan_directory():
+    """Collect the names of all files in the current directory with a single scan"""
+    with os.scandir('.') as entries:
+        return {entry.name for entry in entries}
+
+def read_env_keys(env_file):
+    """Parse the keys defined in an env file, skipping comments"""
+    with open(env_file, 'r') as f:
+        return {
+            line.split('=', 1)[0].strip()
+            for line in f
+            if '=' in line and not line.lstrip().startswith('#')
+        }
+
+def check_env_file(present_files):
     """Check if .env file exists and has required keys"""
     env_file = ".env"
-    if not os.path.exists(env_file):
+    if env_file not in present_files:
         print(f"❌ {env_file} file not found")
         print("Please create a .env file with your API keys:")
         print("GEMINI_API_KEY=your_gemini_api_key_here")
@@ -44,16 +58,11 @@ def check_env_file():
     
     print("✅ .env file found")
     
-    # Check if keys are present
-    with open(env_file, 'r') as f:
-        content = f.read()
+    # Check if keys are defined (a key merely mentioned in another value doesn't count)
+    env_keys = read_env_keys(env_file)
     
     required_keys = ['GEMINI_API_KEY', 'ELEVENLABS_API_KEY']
-    missing_keys = []
-    
-    for key in required_keys:
-        if key not in content or f"{key}=" not in content:
-            missing_keys.append(key)
+    missing_keys = [key for key in required_keys if key not in env_keys]
     
     if missing_keys:
         print(f"⚠️  Missing API keys in .env: {', '.join(missing_keys)}")
@@ -63,7 +72,7 @@ def check_env_file():
     print("✅ Required API keys found in .env")
     return True
 
-def check_data_files():
+def check_data_files(present_files):
     """Check if required data files exist"""
     required_files = [
         'branches.json',
@@ -75,7 +84,7 @@ def check_data_files():
     
     missing_files = []
     for file in required_files:
-        if not os.path.exists(file):
+        if file not in present_files:
             missing_files.append(file)
         else:
             print(f"✅ {file} found")
@@ -100,13 +109,16 @@ def main():
     if not install_requirements():
         return False
     
+    # One directory scan serves both the .env and data file checks
+    present_files = scan_directory()
+    
     # Check environment file
-    if not check_env_file():
+    if not check_env_file(present_files):
         return False
     
     # Check data files
     print("\n📁 Checking data files...")
-    if not check_data_files():
+    if not check_data_files(present_files):
         print("\n💡 Tip: Run 'python reset_data.py' to initialize system")
         return False
     
@@ -0,0 +1,44 @@
+"""
+Tests for scripted replies served from branches.json
+"""
+import os
+import sys
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from branches_manager import BranchesManager
+from response_analyzer import ResponseAnalyzer
+
+CLOSURE_STAGES = frozenset({"closure", "payment_success_closure", "complaint_resolution_closure", "schedule_callback"})
+
+
+class GetScriptedReplyTest(unittest.TestCase):
+    def setUp(self):
+        branches_manager = BranchesManager(
+            os.path.join(REPO_DIR, "branches.json"),
+            os.path.join(REPO_DIR, "suggestions.json")
+        )
+        self.analyzer = ResponseAnalyzer(branches_manager)
+    
+    def test_unscripted_move_into_closure_falls_through(self):
+        # "no" in rebuttals goes to closure with no scripted line; the closure handling speaks it once
+        for user_input in ("no", "nope", "later"):
+            with self.subTest(user_input=user_input):
+                self.assertIsNone(self.analyzer.get_scripted_reply(user_input, "rebuttals", CLOSURE_STAGES))
+    
+    def test_scripted_response_is_returned(self):
+        matched_type, bot_response, next_stage = self.analyzer.get_scripted_reply("yes", "rebuttals", CLOSURE_STAGES)
+        self.assertEqual(matched_type, "yes")
+        self.assertEqual(next_stage, "payment_followup")
+        self.assertTrue(bot_response.startswith("Great!"))
+    
+    def test_closure_stages_default_to_next_bot_prompt(self):
+        matched_type, bot_response, next_stage = self.analyzer.get_scripted_reply("no", "rebuttals")
+        self.assertEqual(next_stage, "closure")
+        self.assertEqual(bot_response, self.analyzer.branches_manager.read_branch("closure")["bot_prompt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Tests for reloading the session file when another process changes it
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+import orjson
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from session_manager import SessionManager
+
+
+class SessionReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.session_file = os.path.join(self.temp_dir.name, "session_data.json")
+        self.manager = SessionManager(
+            os.path.join(self.temp_dir.name, "user_data.json"), self.session_file, flush_interval=0
+        )
+
+    def tearDown(self):
+        self.manager.close()
+        self.temp_dir.cleanup()
+
+    def _write_externally(self, session_data):
+        """Replace the session file the way another process would, with a newer mtime"""
+        old_mtime = os.stat(self.session_file).st_mtime_ns
+        with open(self.session_file, 'wb') as f:
+            f.write(orjson.dumps(session_data))
+        os.utime(self.session_file, ns=(old_mtime + 10**9, old_mtime + 10**9))
+
+    def test_reload_keeps_held_reference(self):
+        self.manager.save_session()
+        session_data = self.manager.get_session_data()
+
+        self._write_externally({"conversation_stage": "payment_followup", "language_preference": "Hindi"})
+
+        self.assertIs(self.manager.get_session_data(), session_data)
+        self.assertEqual(session_data["conversation_stage"], "payment_followup")
+        self.assertEqual(session_data["language_preference"], "Hindi")
+        self.assertEqual(session_data["chat_history"], [])
+
+    def test_updates_after_reload_reach_the_file(self):
+        self.manager.save_session()
+        session_data = self.manager.get_session_data()
+        self._write_externally({"conversation_stage": "payment_followup"})
+        self.manager.get_session_data()
+
+        self.manager.update_session({"last_intent": "yes"})
+        self.manager.save_session()
+
+        self.assertEqual(session_data["last_intent"], "yes")
+        with open(self.session_file, 'rb') as f:
+            saved = orjson.loads(f.read())
+        self.assertEqual(saved["conversation_stage"], "payment_followup")
+        self.assertEqual(saved["last_intent"], "yes")
+
+
+if __name__ == '__main__':
+    unittest.main()
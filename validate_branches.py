@@ -4,14 +4,19 @@ Script to validate branches.json file and identify broken links
 Enhanced to ensure all conversation flows end in proper closure
 """
 
-import json
+import orjson
+import re
 import sys
+from collections import Counter, deque
 from typing import Set, List, Tuple, Dict, Any
 
+# Bot prompts that sound like the end of a call
+_GOODBYE_RE = re.compile(r"thank you|goodbye|have a great day|call ended", re.IGNORECASE)
+
 def analyze_branches():
     # Load the branches.json file
-    with open('branches.json', 'r') as f:
-        branches = json.load(f)
+    with open('branches.json', 'rb') as f:
+        branches = orjson.loads(f.read())
     
     # Get all branch names (exclude metadata)
     branch_names = set(branches.keys())
@@ -27,19 +32,38 @@ def analyze_branches():
     next_references = set()
     broken_links = []
     
-    def extract_next_refs(obj, path=""):
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                current_path = f"{path}.{key}" if path else key
-                if key == "next" and isinstance(value, str):
-                    next_references.add(value)
-                    if value not in actual_branches and value not in metadata_branches:
-                        broken_links.append((current_path, value))
-                else:
-                    extract_next_refs(value, current_path)
-        elif isinstance(obj, list):
-            for i, item in enumerate(obj):
-                extract_next_refs(item, f"{path}[{i}]")
+    def build_path(location):
+        # Rebuild the dotted path from a (parent_location, key_or_index) chain
+        steps = []
+        while location is not None:
+            location, step = location
+            steps.append(step)
+        path = ""
+        for step in reversed(steps):
+            if isinstance(step, int):
+                path += f"[{step}]"
+            else:
+                path = f"{path}.{step}" if path else step
+        return path
+    
+    def extract_next_refs(root):
+        # Explicit stack of (key, value, location) instead of recursion; children are pushed
+        # in reverse so they are visited (and broken links reported) in document order.
+        # Locations are parent links, turned into path strings only for broken links
+        stack = deque([(None, root, None)])
+        while stack:
+            key, obj, location = stack.pop()
+            if key == "next" and isinstance(obj, str):
+                next_references.add(obj)
+                if obj not in actual_branches and obj not in metadata_branches:
+                    broken_links.append((build_path(location), obj))
+            elif isinstance(obj, dict):
+                stack.extend(
+                    (child_key, value, (location, child_key))
+                    for child_key, value in reversed(obj.items())
+                )
+            elif isinstance(obj, list):
+                stack.extend((None, obj[i], (location, i)) for i in reversed(range(len(obj))))
     
     extract_next_refs(branches)
     
@@ -54,33 +78,28 @@ def analyze_branches():
     else:
         print(f"\n✅ ALL LINKS ARE VALID!")
     
+    # Outgoing "next" edges of every branch, extracted once and shared by all checks below
+    succ = {branch_name: branch_successors(branches[branch_name]) for branch_name in actual_branches}
+    
     # Enhanced: Identify conversation endpoints
-    closure_branches = identify_closure_branches(branches, actual_branches)
+    closure_branches = identify_closure_branches(branches, succ)
+    bot_prompts = {branch_name: branches[branch_name].get("bot_prompt", "") for branch_name in actual_branches}
+    
+    # The flat tables above are all the remaining checks need; release the parsed document
+    del branches
     print(f"\n🏁 CONVERSATION ENDPOINTS IDENTIFIED ({len(closure_branches)}):")
     for branch_name, reason in closure_branches.items():
         print(f"  - {branch_name}: {reason}")
     
-    # Check for unreachable branches
-    reachable = set()
-    to_visit = ["greeting"]  # Start with greeting as entry point
+    # Check for unreachable branches (breadth-first; each branch is queued at most once)
+    reachable = {"greeting"} & actual_branches  # Start with greeting as entry point
+    frontier = deque(reachable)
     
-    while to_visit:
-        branch_name = to_visit.pop()
-        if branch_name in reachable or branch_name not in actual_branches:
-            continue
-        
-        reachable.add(branch_name)
-        branch = branches[branch_name]
-        
-        # Check direct "next" in branch
-        if "next" in branch:
-            to_visit.append(branch["next"])
-        
-        # Check "next" in expected_user_responses
-        if "expected_user_responses" in branch:
-            for response_key, response_data in branch["expected_user_responses"].items():
-                if isinstance(response_data, dict) and "next" in response_data:
-                    to_visit.append(response_data["next"])
+    while frontier:
+        for next_branch in succ[frontier.popleft()]:
+            if next_branch in actual_branches and next_branch not in reachable:
+                reachable.add(next_branch)
+                frontier.append(next_branch)
     
     unreachable = actual_branches - reachable
     if unreachable:
@@ -91,7 +110,7 @@ def analyze_branches():
         print(f"\n✅ ALL BRANCHES ARE REACHABLE!")
     
     # Enhanced: Check if all branches can reach closure
-    closure_reachability = check_closure_reachability(branches, actual_branches, closure_branches)
+    closure_reachability = check_closure_reachability(succ, closure_branches)
     branches_cant_reach_closure = []
     infinite_loops = []
     
@@ -119,7 +138,7 @@ def analyze_branches():
             print(f"  - {branch_name}: {' -> '.join(loop_path)}")
     
     # Enhanced: Analyze closure diversity and suggest improvements
-    closure_analysis = analyze_closure_diversity(branches, actual_branches, closure_branches)
+    closure_analysis = analyze_closure_diversity(bot_prompts, succ, closure_branches)
     print(f"\n📊 CLOSURE ANALYSIS:")
     print(f"  - Total closure branches: {len(closure_branches)}")
     print(f"  - Closure types: {closure_analysis['types']}")
@@ -131,7 +150,7 @@ def analyze_branches():
             print(f"  - {suggestion}")
     
     # Enhanced: Check for orphaned conversation paths
-    orphaned_paths = find_orphaned_paths(branches, actual_branches, reachable, closure_branches)
+    orphaned_paths = find_orphaned_paths(succ, reachable, closure_branches)
     if orphaned_paths:
         print(f"\n⚠️  ORPHANED CONVERSATION PATHS ({len(orphaned_paths)}):")
         for path_start, path_description in orphaned_paths:
@@ -165,7 +184,7 @@ def analyze_branches():
         return True
 
 
-def identify_closure_branches(branches: Dict[str, Any], actual_branches: Set[str]) -> Dict[str, str]:
+def identify_closure_branches(branches: Dict[str, Any], succ: Dict[str, List[str]]) -> Dict[str, str]:
     """
     Identify branches that represent conversation endpoints/closures.
     
@@ -174,7 +193,7 @@ def identify_closure_branches(branches: Dict[str, Any], actual_branches: Set[str
     """
     closure_branches = {}
     
-    for branch_name in actual_branches:
+    for branch_name, next_branches in succ.items():
         branch = branches[branch_name]
         
         # Check for explicit END_CALL action
@@ -188,100 +207,150 @@ def identify_closure_branches(branches: Dict[str, Any], actual_branches: Set[str
             continue
         
         # Check if branch has no outgoing paths (dead end)
-        has_next = "next" in branch
-        has_response_nexts = False
-        
-        if "expected_user_responses" in branch:
-            for response_data in branch["expected_user_responses"].values():
-                if isinstance(response_data, dict) and "next" in response_data:
-                    has_response_nexts = True
-                    break
-        
-        if not has_next and not has_response_nexts:
+        if not next_branches:
             closure_branches[branch_name] = "No outgoing paths (natural endpoint)"
     
     return closure_branches
 
 
-def check_closure_reachability(branches: Dict[str, Any], actual_branches: Set[str], 
-                             closure_branches: Dict[str, str]) -> Dict[str, Tuple[bool, Dict[str, Any]]]:
+def branch_successors(branch: Dict[str, Any]) -> List[str]:
     """
-    Check if each branch can eventually reach a closure branch.
-    
-    Returns:
-        Dict mapping branch names to (can_reach_closure, path_info)
+    Collect a branch's outgoing "next" references: its own "next", then those of its expected responses.
     """
-    reachability = {}
+    next_branches = []
     
-    for branch_name in actual_branches:
-        visited = set()
-        path = []
-        can_reach, path_info = can_reach_closure_dfs(
-            branch_name, branches, closure_branches, visited, path
-        )
-        reachability[branch_name] = (can_reach, path_info)
+    if "next" in branch:
+        next_branches.append(branch["next"])
     
-    return reachability
+    if "expected_user_responses" in branch:
+        for response_data in branch["expected_user_responses"].values():
+            if isinstance(response_data, dict) and "next" in response_data:
+                next_branches.append(response_data["next"])
+    
+    return next_branches
 
 
-def can_reach_closure_dfs(current_branch: str, branches: Dict[str, Any], 
-                         closure_branches: Dict[str, str], visited: Set[str], 
-                         path: List[str]) -> Tuple[bool, Dict[str, Any]]:
+def find_strongly_connected_components(succ: Dict[str, List[str]]) -> List[List[str]]:
     """
-    Depth-first search to check if a branch can reach closure.
+    Iterative Tarjan's algorithm over the branch graph.
     
     Returns:
-        (can_reach_closure, path_info_dict)
+        Strongly connected components in reverse topological order (a component
+        comes after every component it has edges into)
     """
-    if current_branch in closure_branches:
-        return True, {"path": path + [current_branch], "closure_type": closure_branches[current_branch]}
-    
-    if current_branch in visited:
-        # Detected a loop
-        loop_start_idx = path.index(current_branch) if current_branch in path else 0
-        loop_path = path[loop_start_idx:] + [current_branch]
-        return False, {"infinite_loop": True, "loop_path": loop_path}
-    
-    if current_branch not in branches:
-        return False, {"dead_end": f"Branch '{current_branch}' does not exist"}
-    
-    visited.add(current_branch)
-    path.append(current_branch)
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    
+    for root in succ:
+        if root in index:
+            continue
+        
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(succ[root]))]
+        
+        while work:
+            node, successors = work[-1]
+            for next_branch in successors:
+                if next_branch not in succ:
+                    continue  # Missing branches have no edges and can't be part of a loop
+                if next_branch not in index:
+                    index[next_branch] = lowlink[next_branch] = len(index)
+                    stack.append(next_branch)
+                    on_stack.add(next_branch)
+                    work.append((next_branch, iter(succ[next_branch])))
+                    break
+                if next_branch in on_stack:
+                    lowlink[node] = min(lowlink[node], index[next_branch])
+            else:
+                # All successors done: fold lowlink into the parent and pop a finished component
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    
+    return components
+
+
+def find_loop_path(start: str, component: Set[str], succ: Dict[str, List[str]]) -> List[str]:
+    """
+    Shortest cycle from a branch back to itself within its strongly connected component.
+    """
+    parents = {}
+    queue = deque([start])
+    
+    while queue:
+        node = queue.popleft()
+        for next_branch in succ[node]:
+            if next_branch == start:
+                path = [node]
+                while path[-1] != start:
+                    path.append(parents[path[-1]])
+                return path[::-1] + [start]
+            if next_branch in component and next_branch not in parents:
+                parents[next_branch] = node
+                queue.append(next_branch)
+    
+    return [start]
+
+
+def check_closure_reachability(succ: Dict[str, List[str]], 
+                             closure_branches: Dict[str, str]) -> Dict[str, Tuple[bool, Dict[str, Any]]]:
+    """
+    Check if each branch can eventually reach a closure branch.
     
-    branch = branches[current_branch]
-    next_branches = []
+    Each branch is visited once: components are resolved sinks-first, so a component
+    can reach closure iff it contains one or has an edge into a component that can.
     
-    # Collect all possible next branches
-    if "next" in branch:
-        next_branches.append(branch["next"])
+    Returns:
+        Dict mapping branch names to (can_reach_closure, path_info)
+    """
+    closure_ok = {}
+    component_of = {}
+    for component in find_strongly_connected_components(succ):
+        can_reach = any(
+            member in closure_branches or any(closure_ok.get(next_branch, False) for next_branch in succ[member])
+            for member in component
+        )
+        members = set(component)
+        for member in component:
+            closure_ok[member] = can_reach
+            component_of[member] = members
     
-    if "expected_user_responses" in branch:
-        for response_data in branch["expected_user_responses"].values():
-            if isinstance(response_data, dict) and "next" in response_data:
-                next_branches.append(response_data["next"])
+    reachability = {}
+    for branch_name, next_branches in succ.items():
+        if branch_name in closure_branches:
+            reachability[branch_name] = (True, {"path": [branch_name], "closure_type": closure_branches[branch_name]})
+        elif closure_ok[branch_name]:
+            via = next(next_branch for next_branch in next_branches if closure_ok.get(next_branch, False))
+            reachability[branch_name] = (True, {"can_reach_via": via})
+        elif len(component_of[branch_name]) > 1 or branch_name in next_branches:
+            # Stuck inside a loop that never leads to a closure
+            loop_path = find_loop_path(branch_name, component_of[branch_name], succ)
+            reachability[branch_name] = (False, {"infinite_loop": True, "loop_path": loop_path})
+        elif not next_branches:
+            reachability[branch_name] = (False, {"dead_end": f"Branch '{branch_name}' has no outgoing paths and is not a closure"})
+        else:
+            reachability[branch_name] = (False, {"dead_end": f"No path to closure from '{branch_name}'"})
     
-    if not next_branches:
-        # This branch has no outgoing paths but isn't marked as closure
-        path.pop()
-        visited.remove(current_branch)
-        return False, {"dead_end": f"Branch '{current_branch}' has no outgoing paths and is not a closure"}
-    
-    # Check if any next branch can reach closure
-    for next_branch in next_branches:
-        can_reach, _ = can_reach_closure_dfs(next_branch, branches, closure_branches, visited, path)
-        if can_reach:
-            path.pop()
-            visited.remove(current_branch)
-            return True, {"can_reach_via": next_branch}
-    
-    # No path to closure found
-    path.pop()
-    visited.remove(current_branch)
-    return False, {"dead_end": f"No path to closure from '{current_branch}'"}
+    return reachability
 
 
-def find_orphaned_paths(branches: Dict[str, Any], actual_branches: Set[str], 
-                       reachable: Set[str], closure_branches: Dict[str, str]) -> List[Tuple[str, str]]:
+def find_orphaned_paths(succ: Dict[str, List[str]], reachable: Set[str], 
+                       closure_branches: Dict[str, str]) -> List[Tuple[str, str]]:
     """
     Find conversation paths that are isolated or problematic.
     
@@ -294,20 +363,9 @@ def find_orphaned_paths(branches: Dict[str, Any], actual_branches: Set[str],
     for branch_name in reachable:
         if branch_name in closure_branches:
             continue
-            
-        branch = branches[branch_name]
         
         # Check if this branch only leads to unreachable branches
-        next_branches = []
-        
-        if "next" in branch:
-            next_branches.append(branch["next"])
-        
-        if "expected_user_responses" in branch:
-            for response_data in branch["expected_user_responses"].values():
-                if isinstance(response_data, dict) and "next" in response_data:
-                    next_branches.append(response_data["next"])
-        
+        next_branches = succ[branch_name]
         if next_branches:
             reachable_nexts = [nb for nb in next_branches if nb in reachable or nb in closure_branches]
             if not reachable_nexts:
@@ -316,7 +374,20 @@ def find_orphaned_paths(branches: Dict[str, Any], actual_branches: Set[str],
     return orphaned
 
 
-def analyze_closure_diversity(branches: Dict[str, Any], actual_branches: Set[str], 
+def closure_type(reason: str) -> str:
+    """
+    Classify a closure by the reason identify_closure_branches gave for it.
+    """
+    if "END_CALL" in reason:
+        return "explicit_end"
+    if "end_conversation" in reason:
+        return "conversation_end"
+    if "natural endpoint" in reason:
+        return "natural_end"
+    return "unknown"
+
+
+def analyze_closure_diversity(bot_prompts: Dict[str, str], succ: Dict[str, List[str]], 
                             closure_branches: Dict[str, str]) -> Dict[str, Any]:
     """
     Analyze the diversity and distribution of closure branches.
@@ -324,49 +395,24 @@ def analyze_closure_diversity(branches: Dict[str, Any], actual_branches: Set[str
     Returns:
         Dict with analysis results and suggestions
     """
+    # Categorize closure types (kept as a plain dict for the report)
     analysis = {
-        "types": {},
+        "types": dict(Counter(closure_type(reason) for reason in closure_branches.values())),
         "most_common_path": None,
         "suggestions": []
     }
     
-    # Categorize closure types
-    for branch_name, reason in closure_branches.items():
-        closure_type = "unknown"
-        if "END_CALL" in reason:
-            closure_type = "explicit_end"
-        elif "end_conversation" in reason:
-            closure_type = "conversation_end"
-        elif "natural endpoint" in reason:
-            closure_type = "natural_end"
-        
-        analysis["types"][closure_type] = analysis["types"].get(closure_type, 0) + 1
-    
-    # Count paths leading to each closure
-    closure_references = {}
-    for branch_name in actual_branches:
-        if branch_name in closure_branches:
-            continue
-            
-        branch = branches[branch_name]
-        next_branches = []
-        
-        if "next" in branch:
-            next_branches.append(branch["next"])
-        
-        if "expected_user_responses" in branch:
-            for response_data in branch["expected_user_responses"].values():
-                if isinstance(response_data, dict) and "next" in response_data:
-                    next_branches.append(response_data["next"])
-        
-        for next_branch in next_branches:
-            if next_branch in closure_branches:
-                closure_references[next_branch] = closure_references.get(next_branch, 0) + 1
+    # Count paths leading to each closure, from the shared successor table
+    closure_references = Counter(
+        next_branch
+        for branch_name, next_branches in succ.items() if branch_name not in closure_branches
+        for next_branch in next_branches if next_branch in closure_branches
+    )
     
     # Find most commonly referenced closure
     if closure_references:
-        most_common = max(closure_references.items(), key=lambda x: x[1])
-        analysis["most_common_path"] = f"{most_common[0]} ({most_common[1]} references)"
+        (most_common_name, most_common_count), = closure_references.most_common(1)
+        analysis["most_common_path"] = f"{most_common_name} ({most_common_count} references)"
     
     # Generate suggestions
     if len(closure_branches) == 1:
@@ -381,15 +427,12 @@ def analyze_closure_diversity(branches: Dict[str, Any], actual_branches: Set[str
     
     # Check for branches that should probably be closures but aren't
     potential_closures = []
-    for branch_name in actual_branches:
+    for branch_name in succ:
         if branch_name in closure_branches:
             continue
         
-        branch = branches[branch_name]
-        
         # Check for goodbye/thank you patterns in bot_prompt
-        prompt = branch.get("bot_prompt", "").lower()
-        if any(word in prompt for word in ["thank you", "goodbye", "have a great day", "call ended"]):
+        if _GOODBYE_RE.search(bot_prompts[branch_name]):
             potential_closures.append(branch_name)
     
     if potential_closures: